@@ -0,0 +1,177 @@
+"""
+Shared aggregation layer for the dashboard, charts and PDF report.
+
+The filtered rows are rolled up once into a compact cube with one row per
+Date x Region x Client x Trainer x Payment Type combination. Every summary
+table, chart input and PDF table is derived from that cube instead of
+re-grouping the raw rows.
+"""
+import numpy as np
+import pandas as pd
+
+CUBE_DIMENSIONS = ['Date', 'Region', 'Client Name', 'Name of Trainer', 'Payment Type']
+ROW_COUNT = 'Row Count'
+
+
+def cube_inputs(df):
+    """The columns of `df` that build_cube reads."""
+    return [col for col in CUBE_DIMENSIONS + ['Cost', 'Session_ID', ROW_COUNT] if col in df.columns]
+
+
+def build_cube(df):
+    """
+    Rolls expense rows up to one row per dimension combination.
+
+    `df` may itself be a (filtered) cube, whose row counts are then added up.
+    """
+    # Loaded rows may store Cost as float32/int32; add it up at full width
+    if df['Cost'].dtype in ('float32', 'int32'):
+        df = df.assign(Cost=df['Cost'].astype('float64' if df['Cost'].dtype == 'float32' else 'int64'))
+
+    # A session is (Date, Client Name), both of which are cube dimensions,
+    # so every raw row in a cube cell shares the same Session_ID.
+    row_count = (ROW_COUNT, 'sum') if ROW_COUNT in df.columns else ('Cost', 'size')
+    cube = df.groupby(CUBE_DIMENSIONS, dropna=False, observed=True).agg(**{
+        'Cost': ('Cost', 'sum'),
+        'Session_ID': ('Session_ID', 'first'),
+        ROW_COUNT: row_count,
+    }).reset_index()
+    # Bucket every cell into its week once, for all the weekly charts
+    cube['Week'] = week_labels(cube['Date'])
+    return cube
+
+
+def as_cube(data):
+    """Returns `data` unchanged if it is already a cube, otherwise builds one."""
+    if ROW_COUNT in data.columns:
+        return data
+    return build_cube(data)
+
+
+def kpi_summary(cube):
+    """Returns total cost, session count, average cost per session and record count."""
+    total_cost = cube['Cost'].sum()
+    total_sessions = cube['Session_ID'].nunique()
+    avg_cost = total_cost / total_sessions if total_sessions > 0 else 0
+    return {
+        'total_cost': total_cost,
+        'total_sessions': total_sessions,
+        'avg_cost': avg_cost,
+        'total_records': int(cube[ROW_COUNT].sum()),
+    }
+
+
+def dimension_stats(cube, by):
+    """Per-group totals shared by the Region and Trainer summaries and charts."""
+    stats = cube.groupby(by, observed=True).agg(**{
+        'Total Cost': ('Cost', 'sum'),
+        'Session Count': ('Session_ID', 'nunique'),
+        'Number of Clients': ('Client Name', 'nunique'),
+        'Unique Days': ('Date', 'nunique'),
+        'First Date': ('Date', 'min'),
+        'Last Date': ('Date', 'max'),
+    })
+    # Weeks between the first and last visit, at least one
+    days = (stats['Last Date'] - stats['First Date']).dt.days
+    stats['Weeks'] = (days / 7).where(days > 0, 1)
+    stats['Average Cost'] = stats['Total Cost'] / stats['Session Count']
+    stats['Average Weekly Cost'] = stats['Total Cost'] / stats['Weeks']
+    return stats
+
+
+def region_summary(cube):
+    """Region Summary table shown on the Trends & Regional tab."""
+    region_stats = dimension_stats(cube, 'Region')
+    region_stats['Average Daily Cost'] = region_stats['Total Cost'] / region_stats['Unique Days']
+    region_stats['Average Client Cost'] = region_stats['Total Cost'] / region_stats['Number of Clients']
+
+    region_stats = region_stats[[
+        'Session Count', 'Number of Clients', 'Total Cost', 'Average Cost',
+        'Average Weekly Cost', 'Average Daily Cost', 'Average Client Cost'
+    ]].round(2)
+    return region_stats.sort_values('Total Cost', ascending=False)
+
+
+def trainer_summary(cube):
+    """Trainer Summary table shown on the Trainer Analysis tab."""
+    trainer_stats = dimension_stats(cube, 'Name of Trainer')
+    trainer_stats = trainer_stats[['Session Count', 'Total Cost', 'Average Cost', 'Average Weekly Cost']].round(2)
+    return trainer_stats.sort_values('Total Cost', ascending=False)
+
+
+def client_totals(cube):
+    """Total cost and session count per (Region, Client Name), highest cost first."""
+    client_stats = cube.groupby(['Region', 'Client Name'], observed=True).agg(**{
+        'Total Cost': ('Cost', 'sum'),
+        'Session Count': ('Session_ID', 'nunique'),
+    }).reset_index()
+    return client_stats.sort_values('Total Cost', ascending=False)
+
+
+def client_summary(cube):
+    """Client Summary table shown on the Client Analysis tab."""
+    client_stats = client_totals(cube)
+    client_stats['Average Cost'] = client_stats['Total Cost'] / client_stats['Session Count']
+    return client_stats[['Region', 'Client Name', 'Session Count', 'Total Cost', 'Average Cost']].round(2)
+
+
+def cost_by(cube, by):
+    """Total cost per group of `by`, in group order."""
+    return cube.groupby(by, observed=True)['Cost'].sum().reset_index()
+
+
+def cost_pivot(cube, index, columns, margins=False):
+    """Cost matrix of `index` x `columns`, zero-filled."""
+    return cube.pivot_table(
+        index=index,
+        columns=columns,
+        values='Cost',
+        aggfunc='sum',
+        fill_value=0,
+        observed=True,
+        margins=margins,
+        margins_name='Grand Total'
+    )
+
+
+def payment_pivot(cube):
+    """Payment by Trainer pivot shown on the Payment Analysis tab."""
+    return cost_pivot(cube, 'Name of Trainer', 'Payment Type', margins=True).round(2)
+
+
+def week_labels(dates):
+    """
+    W-MON week of each date, labelled like resample('W-MON'): weeks run
+    Tuesday to Monday and are named after their closing Monday.
+    """
+    days = dates.dt.normalize()
+    return days + pd.to_timedelta(-days.dt.dayofweek % 7, unit='D')
+
+
+def weekly_matrix(cube, by):
+    """
+    Dense Group x Week cost matrix for any dimension `by`, in one pass.
+
+    Weeks without cost inside a group's first-to-last week span are 0;
+    weeks outside that span are NaN, as resample would not emit them.
+    """
+    weeks = cube['Week'] if 'Week' in cube.columns else week_labels(cube['Date'])
+    cells = cube['Cost'].groupby([cube[by], weeks], observed=True).agg(['sum', 'size'])
+    if cells.empty:
+        return cells['sum'].unstack()
+    all_weeks = pd.date_range(weeks.min(), weeks.max(), freq='W-MON', name='Date')
+    matrix = cells['sum'].unstack(fill_value=0).reindex(columns=all_weeks, fill_value=0)
+    present = cells['size'].unstack(fill_value=0).reindex(columns=all_weeks, fill_value=0).to_numpy() > 0
+
+    # Blank out the weeks before each group's first row and after its last
+    first = present.argmax(axis=1)
+    last = present.shape[1] - 1 - present[:, ::-1].argmax(axis=1)
+    position = np.arange(present.shape[1])
+    return matrix.where((position >= first[:, None]) & (position <= last[:, None]))
+
+
+def weekly_costs(cube, by):
+    """Weekly (W-MON) cost per group of `by`, in long format."""
+    matrix = weekly_matrix(cube, by)
+    weekly = matrix.stack(future_stack=True).dropna().astype(cube['Cost'].dtype)
+    return weekly.rename('Cost').reset_index()
@@ -2,8 +2,6 @@ import streamlit as st
 import os
 from reportlab.platypus import Image
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
 from io import BytesIO
 from datetime import datetime
 from reportlab.lib.pagesizes import letter, A4, landscape, portrait
@@ -14,8 +12,15 @@ from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph,
 from reportlab.lib.enums import TA_CENTER, TA_LEFT
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
-from pdf_generator import generate_expense_report
-from chart_generator import generate_region_charts, generate_trainer_charts, generate_client_charts, generate_payment_charts
+from pdf_generator import CHART_BACKENDS, CHARTS_MISSING_STAGE
+from report_worker import get_report_worker, report_key, ReportCancelled, CACHED_STAGE
+from chart_generator import cached_charts, DEFAULT_COLOR_SEQUENCE, DEFAULT_TEMPLATE
+from data_loader import load_files, read_spilled_table, registry_stats, MissingColumnsError, STREAMING_THRESHOLD_BYTES
+from exports import to_csv_bytes, to_parquet_bytes, to_xlsx_bytes, excel_available
+from sql_backend import SQL_BACKEND_MIN_ROWS, duckdb_available
+from filters import date_bounds, date_range_positions, filter_fingerprint, RowSelection
+from aggregation import build_cube, cube_inputs, kpi_summary, region_summary, trainer_summary, client_summary, payment_pivot
+from instrumentation import span, start_trace, stop_trace
 
 # Set page configuration
 st.set_page_config(
@@ -25,8 +30,15 @@ st.set_page_config(
 )
 
 # --- Constants & Configuration ---
-color_sequence = px.colors.qualitative.Plotly
-chart_template = "plotly_white"
+color_sequence = DEFAULT_COLOR_SEQUENCE
+chart_template = DEFAULT_TEMPLATE
+
+# Start the shared report worker now so fonts and Kaleido are warm by the first report
+report_worker = get_report_worker()
+
+# Trace this rerun's stages when the debug panel (bottom of the sidebar) is on
+if st.session_state.get('debug_trace', False):
+    start_trace('rerun', track_memory=st.session_state.get('debug_memory', False))
 
 # Title and Introduction
 st.title("💰 Expense Analysis Dashboard")
@@ -36,70 +48,81 @@ Upload your CSV file to get started.
 """)
 
 # File Uploader
-uploaded_file = st.sidebar.file_uploader("Upload your CSV file", type=['csv'])
+# Several CSVs (e.g. one per region) or zip archives of them are combined into one dataset
+uploaded_files = st.sidebar.file_uploader(
+    "Upload your CSV files (or a zip archive)",
+    type=['csv', 'zip'],
+    accept_multiple_files=True
+)
+
+# Rows shown in the Detailed Data tab for streamed uploads
+DETAIL_ROW_LIMIT = 100_000
 
-# Initialize session state for data storage
-if 'filtered_df' not in st.session_state:
-    st.session_state.filtered_df = None
-if 'total_cost' not in st.session_state:
-    st.session_state.total_cost = 0
-if 'total_sessions' not in st.session_state:
-    st.session_state.total_sessions = 0
-if 'avg_cost' not in st.session_state:
-    st.session_state.avg_cost = 0
+# How often a running PDF job's progress is refreshed, in seconds
+PDF_POLL_SECONDS = 0.5
+
+# Initialize session state. The uploaded data itself is never stored per
+# session: every session reads the same cached, read-only dataset and keeps
+# only its widget state (and so its row selection) and its PDF.
 if 'pdf_data' not in st.session_state:
     st.session_state.pdf_data = None
+if 'pdf_job' not in st.session_state:
+    st.session_state.pdf_job = None
+if 'pdf_trace' not in st.session_state:
+    st.session_state.pdf_trace = None
 
 
 
 
 
-if uploaded_file is not None:
+if uploaded_files:
     try:
-        # Load data - Try reading with header=1 first (skipping the first metadata row)
-        # We read the first few lines to check the structure
-        uploaded_file.seek(0)
-        first_line = uploaded_file.readline().decode('utf-8')
-        uploaded_file.seek(0)
-        
-        if first_line.startswith(',,,,,'):
-            # If the first line looks like metadata (mostly empty), skip it
-            df = pd.read_csv(uploaded_file, header=1)
-        else:
-            df = pd.read_csv(uploaded_file)
-        
-        # Data Cleaning: Strip whitespace from column names
-        df.columns = df.columns.str.strip()
-        
-        # Validate required columns
-        # Note: The user's CSV has 'Date ' with a space, which we stripped above.
-        required_columns = ['Date', 'Region', 'Client Name', 'Cost', 'Name of Trainer', 'Payment Type']
-        missing_columns = [col for col in required_columns if col not in df.columns]
+        # Load and clean the data. Parsing is cached by file content, so
+        # widget reruns reuse the already cleaned dataframe.
+        # A "Session" is a unique combination of Date and Client Name (Session_ID).
+        # Large files are streamed into an aggregation cube instead of being
+        # held as rows; the raw rows are spilled to disk for the Detailed Data tab.
+        streaming = st.sidebar.checkbox(
+            "Low-memory mode (stream file)",
+            value=sum(f.size for f in uploaded_files) >= STREAMING_THRESHOLD_BYTES,
+            help="Aggregate the file chunk by chunk instead of keeping every row in memory."
+        )
+        all_columns = st.sidebar.checkbox(
+            "Keep all CSV columns",
+            value=False,
+            help="Also load columns the dashboard does not use (e.g. Remarks) so they show in Detailed Data."
+        )
+        try:
+            with span('load') as s:
+                files = [(f.name, f.getvalue()) for f in uploaded_files]
+                dataset = load_files(files, streaming=streaming, all_columns=all_columns)
+                s.rows_out = len(dataset.df)
+            df = dataset.df
+            missing_columns = []
+        except MissingColumnsError as e:
+            missing_columns = e.missing
+            available_columns = e.available
+            missing_message = str(e)
         
         if missing_columns:
-            st.error(f"The uploaded file is missing the following required columns: {', '.join(missing_columns)}")
-            st.write("Available columns:", df.columns.tolist())
+            st.error(missing_message)
+            st.write("Available columns:", available_columns)
         else:
-            # Data Preprocessing
-            # Handle potential mixed formats in Date column
-            df['Date'] = pd.to_datetime(df['Date'], errors='coerce', dayfirst=True)
-            df['Cost'] = pd.to_numeric(df['Cost'], errors='coerce')
-            
-            # Drop rows with missing essential data
-            df = df.dropna(subset=['Date', 'Cost'])
-            
-            # --- Session Logic Refinement ---
-            # A "Session" is defined as a unique combination of Date and Client Name.
-            # As per user request, we use Client Name & Date parameters.
-            df['Session_ID'] = df['Date'].astype(str) + "_" + df['Client Name']
+            # Large datasets are filtered and aggregated by the embedded DuckDB
+            # engine over a local Parquet copy instead of by pandas
+            use_sql = st.sidebar.checkbox(
+                "SQL engine (DuckDB)",
+                value=duckdb_available() and dataset.index.n_rows >= SQL_BACKEND_MIN_ROWS,
+                disabled=not duckdb_available(),
+                help="Run the filtered aggregation as a SQL query over a Parquet copy of the data. Requires the duckdb package."
+            )
             
             # --- Sidebar Filters ---
             st.sidebar.header("Filters")
             
-            # Date Range Filter
+            # Date Range Filter (the loaded data is sorted by Date)
             if not df['Date'].empty:
-                min_date = df['Date'].min().date()
-                max_date = df['Date'].max().date()
+                min_date, max_date = date_bounds(df)
                 
                 date_range = st.sidebar.date_input(
                     "Select Date Range",
@@ -111,41 +134,90 @@ if uploaded_file is not None:
                 # Filter data by date
                 if len(date_range) == 2:
                     start_date, end_date = date_range
-                    mask = (df['Date'].dt.date >= start_date) & (df['Date'].dt.date <= end_date)
-                    filtered_df = df.loc[mask]
+                    with span('filter:date', rows_in=len(df)) as s:
+                        rows = RowSelection(*date_range_positions(df, start_date, end_date))
+                        s.rows_out = len(rows)
                 else:
-                    filtered_df = df
+                    start_date = end_date = None
+                    rows = dataset.index.all_rows()
             else:
-                filtered_df = df
+                start_date = end_date = None
+                rows = dataset.index.all_rows()
+            
+            # (column, values) pairs actually applied, to re-read spilled rows
+            applied_filters = []
+            
+            # The option lists and selections below come from the dataset's
+            # inverted index; no rows are copied until the final selection.
             
             # Region Filter
-            regions = sorted(filtered_df['Region'].dropna().unique())
+            regions = dataset.index.values('Region', rows)
             selected_regions = st.sidebar.multiselect("Select Region", regions, default=regions)
             
             if selected_regions:
-                filtered_df = filtered_df[filtered_df['Region'].isin(selected_regions)]
+                with span('filter:region', rows_in=len(rows)) as s:
+                    rows = dataset.index.select('Region', selected_regions, rows)
+                    s.rows_out = len(rows)
+                applied_filters.append(('Region', selected_regions))
                 
             # Client Filter
-            clients = sorted(filtered_df['Client Name'].dropna().unique())
+            clients = dataset.index.values('Client Name', rows)
             selected_clients = st.sidebar.multiselect("Select Client", clients, default=clients)
             
             if selected_clients:
-                filtered_df = filtered_df[filtered_df['Client Name'].isin(selected_clients)]
+                with span('filter:client', rows_in=len(rows)) as s:
+                    rows = dataset.index.select('Client Name', selected_clients, rows)
+                    s.rows_out = len(rows)
+                applied_filters.append(('Client Name', selected_clients))
 
             # Trainer Filter
-            trainers = sorted(filtered_df['Name of Trainer'].dropna().unique())
+            trainers = dataset.index.values('Name of Trainer', rows)
             selected_trainers = st.sidebar.multiselect("Select Trainer", trainers, default=trainers)
             
             if selected_trainers:
-                filtered_df = filtered_df[filtered_df['Name of Trainer'].isin(selected_trainers)]
+                with span('filter:trainer', rows_in=len(rows)) as s:
+                    rows = dataset.index.select('Name of Trainer', selected_trainers, rows)
+                    s.rows_out = len(rows)
+                applied_filters.append(('Name of Trainer', selected_trainers))
             
-            # --- Generate Charts ---
-            # Generate all charts once to be used in both UI and PDF
-            charts = {}
-            charts.update(generate_region_charts(filtered_df, color_sequence, chart_template))
-            charts.update(generate_trainer_charts(filtered_df, color_sequence, chart_template))
-            charts.update(generate_client_charts(filtered_df, color_sequence, chart_template))
-            charts.update(generate_payment_charts(filtered_df, color_sequence, chart_template))
+            # Payment Type Filter (only narrows once something is deselected, so
+            # rows without a payment type stay in the default view)
+            payment_types = dataset.index.values('Payment Type', rows)
+            selected_payment_types = st.sidebar.multiselect("Select Payment Type", payment_types, default=payment_types)
+            
+            if selected_payment_types and len(selected_payment_types) < len(payment_types):
+                with span('filter:payment_type', rows_in=len(rows)) as s:
+                    rows = dataset.index.select('Payment Type', selected_payment_types, rows)
+                    s.rows_out = len(rows)
+                applied_filters.append(('Payment Type', selected_payment_types))
+            
+            # --- Aggregation Cube ---
+            # Roll the filtered rows up once per filter state; every table, chart and
+            # the PDF read from it
+            def roll_up():
+                # The rows are shared with every other session, so they are only read
+                # through this session's row selection, never copied whole
+                if use_sql:
+                    # The query applies the same filters itself
+                    with span('cube:sql', rows_in=len(rows)) as s:
+                        cube = dataset.sql_backend().cube(start_date, end_date, applied_filters)
+                        s.rows_out = len(cube)
+                    return cube
+                with span('filter:apply', rows_in=len(df)) as s:
+                    cube_rows = rows.apply(df, cube_inputs(df))
+                    s.rows_out = len(cube_rows)
+                with span('cube', rows_in=len(cube_rows)) as s:
+                    cube = build_cube(cube_rows)
+                    s.rows_out = len(cube)
+                return cube
+            
+            # --- Charts ---
+            # The cube and each figure (built the first time the open tab or the PDF
+            # asks for it) are reused by later reruns, and other sessions, with the
+            # same filters, so toggling PDF options or downloading rebuilds nothing
+            filter_state = filter_fingerprint(dataset.key, start_date, end_date, applied_filters)
+            charts = cached_charts(filter_state, roll_up, color_sequence, chart_template)
+            cube = charts.cube
 
             # --- PDF Export in Sidebar ---
             st.sidebar.markdown("---")
@@ -165,6 +237,13 @@ if uploaded_file is not None:
                 index=0  # Default to Portrait
             )
             
+            # Chart renderer: Plotly via Kaleido, or native ReportLab drawings (no browser needed)
+            chart_backend = st.sidebar.selectbox(
+                "Chart Renderer",
+                options=CHART_BACKENDS,
+                format_func={'plotly': "Plotly (Kaleido)", 'reportlab': "ReportLab (native, faster)"}.get
+            )
+            
             # Cover Page Option
             include_cover = st.sidebar.checkbox("Include Cover Page", value=True)
             
@@ -182,284 +261,314 @@ if uploaded_file is not None:
             include_payment = st.sidebar.checkbox("Payment Analysis", value=select_all, key="payment_check")
             
             if st.sidebar.button("Generate PDF Report", key="generate_pdf"):
-                with st.spinner("Generating PDF report..."):
+                # Collect options
+                options = {
+                    'page_size': page_size,
+                    'orientation': orientation,
+                    'chart_backend': chart_backend,
+                    'include_cover': include_cover,
+                    'include_kpi': include_kpi,
+                    'include_region': include_region,
+                    'include_trainer': include_trainer,
+                    'include_client': include_client,
+                    'include_payment': include_payment
+                }
+                
+                # Queue the report in the background; clicking again while the
+                # same report is being built keeps the job already running
+                with span('pdf:submit', rows_in=len(cube)):
+                    key = report_key(cube, options, color_sequence, chart_template)
+                    job = st.session_state.pdf_job
+                    if job is None or job.key != key:
+                        if job is not None:
+                            job.cancel()
+                        st.session_state.pdf_job = report_worker.submit(cube, options, charts, key=key,
+                                                                        color_sequence=color_sequence)
+                        st.session_state.pdf_data = None
+                        st.session_state.pdf_trace = None
+            
+            # Progress of the PDF job, refreshed on its own while it runs, then
+            # its result and the download button
+            polling = st.session_state.pdf_job is not None and not st.session_state.pdf_job.done()
+            
+            @st.fragment(run_every=PDF_POLL_SECONDS if polling else None)
+            def pdf_job_status():
+                job = st.session_state.pdf_job
+                if job is not None and not job.done():
+                    st.progress(job.progress, text=f"Generating PDF report: {job.stage}...")
+                    if st.button("Cancel", key='cancel-pdf'):
+                        job.cancel()
+                        st.session_state.pdf_job = None
+                        st.rerun()
+                    return
+                if polling:
+                    # Finished since the last full run: rerun it to stop polling
+                    st.rerun()
+                if job is not None:
+                    st.session_state.pdf_job = None
+                    # The report ran on a worker thread, in its own trace
+                    if job.trace is not None:
+                        job.trace.log()
+                        st.session_state.pdf_trace = job.trace
                     try:
-                        # Collect options
-                        options = {
-                            'page_size': page_size,
-                            'orientation': orientation,
-                            'include_cover': include_cover,
-                            'include_kpi': include_kpi,
-                            'include_region': include_region,
-                            'include_trainer': include_trainer,
-                            'include_client': include_client,
-                            'include_payment': include_payment
-                        }
-                        
-                        # Generate PDF
-                        pdf_bytes = generate_expense_report(filtered_df, options, charts)
-                        
-                        # Store in session state
-                        st.session_state.pdf_data = pdf_bytes
-                        st.sidebar.success("✅ PDF Generated!")
-                        
+                        st.session_state.pdf_data = job.result()
+                        if job.stage == CHARTS_MISSING_STAGE:
+                            st.warning("PDF generated, but some charts could not be rendered.")
+                        else:
+                            st.success("✅ PDF Generated!" + (" (from cache)" if job.stage == CACHED_STAGE else ""))
+                    except ReportCancelled:
+                        st.info("PDF generation cancelled.")
                     except Exception as e:
-                        st.sidebar.error(f"PDF Generation Error: {str(e)}")
+                        st.error(f"PDF Generation Error: {str(e)}")
                         st.session_state.pdf_data = None
+                
+                # Show download button if PDF data is available
+                if st.session_state.pdf_data:
+                    st.download_button(
+                        label="📥 Download PDF",
+                        data=st.session_state.pdf_data,
+                        file_name=f"expense_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf",
+                        mime="application/pdf",
+                        key='download-pdf-report'
+                    )
+                
+                # Stage timings of the last report, while the debug panel is on
+                pdf_trace = st.session_state.pdf_trace
+                if pdf_trace is not None and st.session_state.get('debug_trace', False):
+                    st.caption(f"PDF report took {pdf_trace.seconds * 1000:,.0f} ms")
+                    st.dataframe(pd.DataFrame(pdf_trace.rows()), hide_index=True)
             
-            # Show download button if PDF data is available
-            if st.session_state.pdf_data:
-                st.sidebar.download_button(
-                    label="📥 Download PDF",
-                    data=st.session_state.pdf_data,
-                    file_name=f"expense_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf",
-                    mime="application/pdf",
-                    key='download-pdf-report'
-                )
+            with st.sidebar:
+                pdf_job_status()
             
 
-            # Compute total cost and session count
-            total_cost = filtered_df['Cost'].sum()
-            total_sessions = filtered_df['Session_ID'].nunique()
-            # Average Cost per Session
-            avg_cost = total_cost / total_sessions if total_sessions > 0 else 0
-            
-            # Store in session state for export functionality
-            st.session_state.filtered_df = filtered_df
-            st.session_state.total_cost = total_cost
+            # Selection totals (the Detailed Data tab shows the record count)
+            with span('table:kpi', rows_in=len(cube)):
+                kpis = kpi_summary(cube)
             
             # --- Tabs for Visualizations ---
-            tab1, tab2, tab3, tab4, tab5 = st.tabs(["📈 Trends & Regional", "👨‍🏫 Trainer Analysis", "🏢 Client Analysis", "💳 Payment Analysis", "📋 Detailed Data"])
+            # Only the selected tab's content runs, so its tables and charts are
+            # the only ones computed on a rerun
+            tab1, tab2, tab3, tab4, tab5 = st.tabs(
+                ["📈 Trends & Regional", "👨‍🏫 Trainer Analysis", "🏢 Client Analysis", "💳 Payment Analysis", "📋 Detailed Data"],
+                on_change="rerun",
+                key="dashboard_tab"
+            )
             
-            with tab1:
-                st.subheader("Region Summary")
-                
-                region_stats = filtered_df.groupby('Region').agg({
-                    'Cost': ['sum', 'mean'],
-                    'Client Name': 'nunique',
-                    'Date': 'nunique',
-                    'Session_ID': 'nunique'
-                })
-                region_stats.columns = ['Total Cost', 'Average Cost (Row)', 'Number of Clients', 'Unique Days', 'Session Count']
-                
-                # Recalculate Average Cost based on Sessions
-                region_stats['Average Cost'] = region_stats['Total Cost'] / region_stats['Session Count']
-                
-                # Average Weekly Cost
-                weeks_per_region = filtered_df.groupby('Region')['Date'].apply(lambda x: (x.max() - x.min()).days / 7 if (x.max() - x.min()).days > 0 else 1)
-                region_stats['Average Weekly Cost'] = region_stats['Total Cost'] / weeks_per_region
-                
-                # Average Daily Cost
-                region_stats['Average Daily Cost'] = region_stats['Total Cost'] / region_stats['Unique Days']
-                
-                # Average Client Cost
-                region_stats['Average Client Cost'] = region_stats['Total Cost'] / region_stats['Number of Clients']
-                
-                # Reorder and Format
-                region_stats = region_stats[[
-                    'Session Count', 'Number of Clients', 'Total Cost', 'Average Cost', 
-                    'Average Weekly Cost', 'Average Daily Cost', 'Average Client Cost'
-                ]].round(2)
-                
-                # Sorting: Sort by Total Cost descending as requested
-                region_stats = region_stats.sort_values('Total Cost', ascending=False)
-                
-                st.data_editor(region_stats, use_container_width=True, disabled=True, hide_index=False)
-                
-                # Download button for Region Summary
-                csv_region = region_stats.to_csv(index=True).encode('utf-8')
-                st.download_button(
-                    label="📥 Download Region Summary",
-                    data=csv_region,
-                    file_name="region_summary.csv",
-                    mime="text/csv",
-                    key='download-region-summary'
-                )
-                
-                st.markdown("---")
-                
-                col_a, col_b = st.columns(2)
-                
-                with col_a:
-                    st.subheader("Regional Cost Distribution")
-                    if 'region_pie' in charts:
-                        st.plotly_chart(charts['region_pie'], use_container_width=True)
+            if tab1.open:
+                with tab1:
+                    st.subheader("Region Summary")
                     
-                with col_b:
-                    st.subheader("Weekly Cost Trends by Region")
-                    if 'region_trend' in charts:
-                        st.plotly_chart(charts['region_trend'], use_container_width=True)
-                    else:
-                        st.info("No data available for trends.")
-                
-                st.subheader("Regional Cost Analysis")
-                if 'region_bar_group' in charts:
-                    st.plotly_chart(charts['region_bar_group'], use_container_width=True)
-                
-                st.markdown("---")
-                st.subheader("Regional Activity Overview")
-                
-                if 'region_activity' in charts:
-                    st.plotly_chart(charts['region_activity'], use_container_width=True)
+                    # Sorted by Total Cost descending
+                    with span('table:region', rows_in=len(cube)):
+                        region_stats = region_summary(cube)
+                    
+                    st.data_editor(region_stats, use_container_width=True, disabled=True, hide_index=False)
+                    
+                    # Download button for Region Summary (the CSV is built on click)
+                    st.download_button(
+                        label="📥 Download Region Summary",
+                        data=lambda: to_csv_bytes(region_stats, index=True),
+                        file_name="region_summary.csv",
+                        mime="text/csv",
+                        key='download-region-summary'
+                    )
+                    
+                    st.markdown("---")
+                    
+                    col_a, col_b = st.columns(2)
+                    
+                    with col_a:
+                        st.subheader("Regional Cost Distribution")
+                        if 'region_pie' in charts:
+                            st.plotly_chart(charts['region_pie'], use_container_width=True)
+                        
+                    with col_b:
+                        st.subheader("Weekly Cost Trends by Region")
+                        if 'region_trend' in charts:
+                            st.plotly_chart(charts['region_trend'], use_container_width=True)
+                        else:
+                            st.info("No data available for trends.")
+                    
+                    st.subheader("Regional Cost Analysis")
+                    if 'region_bar_group' in charts:
+                        st.plotly_chart(charts['region_bar_group'], use_container_width=True)
+                    
+                    st.markdown("---")
+                    st.subheader("Regional Activity Overview")
+                    
+                    if 'region_activity' in charts:
+                        st.plotly_chart(charts['region_activity'], use_container_width=True)
 
-            with tab2:
-                st.subheader("Trainer Summary")
-                
-                trainer_stats = filtered_df.groupby('Name of Trainer').agg({
-                    'Cost': 'sum',
-                    'Session_ID': 'nunique',
-                    'Date': lambda x: (x.max() - x.min()).days / 7 if (x.max() - x.min()).days > 0 else 1
-                })
-                trainer_stats.columns = ['Total Cost', 'Session Count', 'Weeks']
-                
-                trainer_stats['Average Cost'] = trainer_stats['Total Cost'] / trainer_stats['Session Count']
-                trainer_stats['Average Weekly Cost'] = trainer_stats['Total Cost'] / trainer_stats['Weeks']
-                
-                trainer_stats = trainer_stats[['Session Count', 'Total Cost', 'Average Cost', 'Average Weekly Cost']].round(2)
-                trainer_stats = trainer_stats.sort_values('Total Cost', ascending=False)
-                
-                st.data_editor(trainer_stats, use_container_width=True, disabled=True, hide_index=False)
-                
-                # Download button for Trainer Summary
-                csv_trainer = trainer_stats.to_csv(index=True).encode('utf-8')
-                st.download_button(
-                    label="📥 Download Trainer Summary",
-                    data=csv_trainer,
-                    file_name="trainer_summary.csv",
-                    mime="text/csv",
-                    key='download-trainer-summary'
-                )
-                
-                st.markdown("---")
-                
-                col_t1, col_t2 = st.columns(2)
-                
-                with col_t1:
-                    st.markdown("#### Trainer Expenses by Payment Method")
-                    if 'trainer_payment' in charts:
-                        st.plotly_chart(charts['trainer_payment'], use_container_width=True)
+            if tab2.open:
+                with tab2:
+                    st.subheader("Trainer Summary")
+                    
+                    with span('table:trainer', rows_in=len(cube)):
+                        trainer_stats = trainer_summary(cube)
+                    
+                    st.data_editor(trainer_stats, use_container_width=True, disabled=True, hide_index=False)
+                    
+                    # Download button for Trainer Summary
+                    st.download_button(
+                        label="📥 Download Trainer Summary",
+                        data=lambda: to_csv_bytes(trainer_stats, index=True),
+                        file_name="trainer_summary.csv",
+                        mime="text/csv",
+                        key='download-trainer-summary'
+                    )
+                    
+                    st.markdown("---")
+                    
+                    col_t1, col_t2 = st.columns(2)
+                    
+                    with col_t1:
+                        st.markdown("#### Trainer Expenses by Payment Method")
+                        if 'trainer_payment' in charts:
+                            st.plotly_chart(charts['trainer_payment'], use_container_width=True)
+                            
+                    with col_t2:
+                        st.markdown("#### Regional-Trainer Cost Heatmap")
+                        if 'trainer_heatmap' in charts:
+                            st.plotly_chart(charts['trainer_heatmap'], use_container_width=True)
+                    
+                    st.markdown("---")
+                    
+                    col_t3, col_t4 = st.columns(2)
+                    
+                    with col_t3:
+                        st.markdown("#### Trainer Cost Efficiency Analysis")
+                        if 'trainer_efficiency' in charts:
+                            st.plotly_chart(charts['trainer_efficiency'], use_container_width=True)
                         
-                with col_t2:
-                    st.markdown("#### Regional-Trainer Cost Heatmap")
-                    if 'trainer_heatmap' in charts:
-                        st.plotly_chart(charts['trainer_heatmap'], use_container_width=True)
-                
-                st.markdown("---")
-                
-                col_t3, col_t4 = st.columns(2)
-                
-                with col_t3:
-                    st.markdown("#### Trainer Cost Efficiency Analysis")
-                    if 'trainer_efficiency' in charts:
-                        st.plotly_chart(charts['trainer_efficiency'], use_container_width=True)
+                    with col_t4:
+                        st.markdown("#### Trainer Cost Share")
+                        if 'trainer_pie' in charts:
+                            st.plotly_chart(charts['trainer_pie'], use_container_width=True)
                     
-                with col_t4:
-                    st.markdown("#### Trainer Cost Share")
-                    if 'trainer_pie' in charts:
-                        st.plotly_chart(charts['trainer_pie'], use_container_width=True)
-                
-                st.markdown("---")
-                
-                st.markdown("#### Weekly Cost Trends by Trainer")
-                if 'trainer_trend' in charts:
-                    st.plotly_chart(charts['trainer_trend'], use_container_width=True)
+                    st.markdown("---")
+                    
+                    st.markdown("#### Weekly Cost Trends by Trainer")
+                    if 'trainer_trend' in charts:
+                        st.plotly_chart(charts['trainer_trend'], use_container_width=True)
 
-            with tab3:
-                st.subheader("Client Summary")
-                
-                client_summary = filtered_df.groupby(['Region', 'Client Name']).agg({
-                    'Cost': 'sum',
-                    'Session_ID': 'nunique'
-                }).reset_index()
-                
-                client_summary['Average Cost'] = client_summary['Cost'] / client_summary['Session_ID']
-                client_summary.columns = ['Region', 'Client Name', 'Total Cost', 'Session Count', 'Average Cost']
-                
-                # Reorder columns
-                client_summary = client_summary[['Region', 'Client Name', 'Session Count', 'Total Cost', 'Average Cost']].round(2)
-                # Sort by Total Cost Descending
-                client_summary = client_summary.sort_values('Total Cost', ascending=False)
-                
-                st.data_editor(client_summary, use_container_width=True, disabled=True, hide_index=False)
-                
-                # Download button for Client Summary
-                csv_client = client_summary.to_csv(index=False).encode('utf-8')
-                st.download_button(
-                    label="📥 Download Client Summary",
-                    data=csv_client,
-                    file_name="client_summary.csv",
-                    mime="text/csv",
-                    key='download-client-summary'
-                )
-                
-                st.subheader("Client Cost Overview")
-                if 'client_cost' in charts:
-                    st.plotly_chart(charts['client_cost'], use_container_width=True)
+            if tab3.open:
+                with tab3:
+                    st.subheader("Client Summary")
+                    
+                    # Sorted by Total Cost descending
+                    with span('table:client', rows_in=len(cube)):
+                        client_stats = client_summary(cube)
+                    
+                    st.data_editor(client_stats, use_container_width=True, disabled=True, hide_index=False)
+                    
+                    # Download button for Client Summary
+                    st.download_button(
+                        label="📥 Download Client Summary",
+                        data=lambda: to_csv_bytes(client_stats),
+                        file_name="client_summary.csv",
+                        mime="text/csv",
+                        key='download-client-summary'
+                    )
+                    
+                    st.subheader("Client Cost Overview")
+                    if 'client_cost' in charts:
+                        st.plotly_chart(charts['client_cost'], use_container_width=True)
             
-                st.subheader("Client Session Analysis")
-                if 'client_scatter' in charts:
-                    st.plotly_chart(charts['client_scatter'], use_container_width=True)
+                    st.subheader("Client Session Analysis")
+                    if 'client_scatter' in charts:
+                        st.plotly_chart(charts['client_scatter'], use_container_width=True)
             
-            with tab4:
-                st.subheader("Payment Analysis")
-                
-                payment_pivot = filtered_df.pivot_table(
-                    index='Name of Trainer',
-                    columns='Payment Type',
-                    values='Cost',
-                    aggfunc='sum',
-                    fill_value=0,
-                    margins=True,
-                    margins_name='Grand Total'
-                ).round(2)
-                
-                st.markdown("#### Payment by Trainer")
-                st.data_editor(payment_pivot, use_container_width=True, disabled=True, hide_index=False)
-                
-                # Download button for Payment Pivot
-                csv_payment = payment_pivot.to_csv(index=True).encode('utf-8')
-                st.download_button(
-                    label="📥 Download Payment Summary",
-                    data=csv_payment,
-                    file_name="payment_by_trainer.csv",
-                    mime="text/csv",
-                    key='download-payment-pivot'
-                )
-                
-                st.markdown("---")
-                
-                col_p1, col_p2 = st.columns(2)
-                
-                with col_p1:
-                    st.markdown("#### Payment Method Distribution")
-                    if 'payment_pie' in charts:
-                        st.plotly_chart(charts['payment_pie'], use_container_width=True)
+            if tab4.open:
+                with tab4:
+                    st.subheader("Payment Analysis")
+                    
+                    with span('table:payment', rows_in=len(cube)):
+                        payment_stats = payment_pivot(cube)
+                    
+                    st.markdown("#### Payment by Trainer")
+                    st.data_editor(payment_stats, use_container_width=True, disabled=True, hide_index=False)
+                    
+                    # Download button for Payment Pivot
+                    st.download_button(
+                        label="📥 Download Payment Summary",
+                        data=lambda: to_csv_bytes(payment_stats, index=True),
+                        file_name="payment_by_trainer.csv",
+                        mime="text/csv",
+                        key='download-payment-pivot'
+                    )
+                    
+                    st.markdown("---")
+                    
+                    col_p1, col_p2 = st.columns(2)
                     
-                with col_p2:
-                    st.markdown("#### Payment Methods by Region")
-                    if 'payment_stack' in charts:
-                        st.plotly_chart(charts['payment_stack'], use_container_width=True)
+                    with col_p1:
+                        st.markdown("#### Payment Method Distribution")
+                        if 'payment_pie' in charts:
+                            st.plotly_chart(charts['payment_pie'], use_container_width=True)
+                        
+                    with col_p2:
+                        st.markdown("#### Payment Methods by Region")
+                        if 'payment_stack' in charts:
+                            st.plotly_chart(charts['payment_stack'], use_container_width=True)
 
-            with tab5:
-                st.subheader("Raw Data")
-                st.dataframe(filtered_df)
-                
-                # Download Button
-                csv = filtered_df.to_csv(index=False).encode('utf-8')
-                st.download_button(
-                    "Download Filtered Data",
-                    csv,
-                    "filtered_data.csv",
-                    "text/csv",
-                    key='download-csv'
-                )
+            if tab5.open:
+                with tab5:
+                    st.subheader("Raw Data")
+                    if dataset.streamed:
+                        # Streamed uploads keep their raw rows on disk; show the first
+                        # rows and read the full selection only when downloaded. The
+                        # Arrow table goes to the widget and the export writers as is.
+                        st.dataframe(read_spilled_table(dataset.spill_path, start_date, end_date, applied_filters, limit=DETAIL_ROW_LIMIT))
+                        st.caption(f"Showing the first {min(DETAIL_ROW_LIMIT, kpis['total_records']):,} of {kpis['total_records']:,} rows.")
+                        detail_rows = lambda: read_spilled_table(dataset.spill_path, start_date, end_date, applied_filters)
+                    else:
+                        filtered_df = rows.apply(df)
+                        st.dataframe(filtered_df)
+                        detail_rows = lambda: filtered_df
+                    
+                    # Download Buttons: each export is built, chunk by chunk, only when clicked
+                    col_csv, col_parquet, col_xlsx = st.columns(3)
+                    with col_csv:
+                        st.download_button(
+                            "Download Filtered Data (CSV)",
+                            lambda: to_csv_bytes(detail_rows()),
+                            "filtered_data.csv",
+                            "text/csv",
+                            key='download-csv'
+                        )
+                    with col_parquet:
+                        st.download_button(
+                            "Download Filtered Data (Parquet)",
+                            lambda: to_parquet_bytes(detail_rows()),
+                            "filtered_data.parquet",
+                            "application/octet-stream",
+                            key='download-parquet'
+                        )
+                    with col_xlsx:
+                        # One workbook: the summary tables plus the filtered rows
+                        st.download_button(
+                            "Download Excel Workbook",
+                            lambda: to_xlsx_bytes([
+                                ('Region Summary', region_summary(cube), True),
+                                ('Trainer Summary', trainer_summary(cube), True),
+                                ('Client Summary', client_summary(cube), False),
+                                ('Payment by Trainer', payment_pivot(cube), True),
+                                ('Filtered Data', detail_rows(), False),
+                            ]),
+                            "expense_analysis.xlsx",
+                            "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                            key='download-xlsx',
+                            disabled=not excel_available(),
+                            help=None if excel_available() else "Requires the xlsxwriter package."
+                        )
             
 
 
     except Exception as e:
         st.error(f"Error processing file: {e}")
 else:
-    st.info("Please upload a CSV file to view the dashboard.")
+    st.info("Please upload one or more CSV files to view the dashboard.")
     
     # Show sample data format
     st.markdown("### Expected CSV Format")
@@ -471,3 +580,27 @@ else:
     - **Client Name**: Name of the client
     - **Cost**: Numeric cost value
     """)
+
+# --- Debug Panel ---
+# Per-stage wall time, rows in/out and (optionally) peak memory of this rerun
+st.sidebar.markdown("---")
+debug_trace = st.sidebar.checkbox("🛠️ Performance Debug Panel", key='debug_trace')
+trace = stop_trace()
+if debug_trace:
+    st.sidebar.checkbox("Track peak memory (slower)", key='debug_memory')
+    if trace is None:
+        st.sidebar.caption("Stage timings appear from the next rerun.")
+    else:
+        st.sidebar.caption(f"Rerun took {trace.seconds * 1000:,.0f} ms")
+        st.sidebar.dataframe(pd.DataFrame(trace.rows()), hide_index=True)
+        st.sidebar.download_button(
+            label="📥 Download Trace (JSON)",
+            data=trace.to_json(),
+            file_name=f"trace_{trace.started.strftime('%Y%m%d_%H%M%S')}.json",
+            mime="application/json",
+            key='download-trace'
+        )
+        trace.log()
+    # Parsed uploads held once per server process and shared by every session
+    st.sidebar.caption("Shared datasets (all sessions)")
+    st.sidebar.dataframe(pd.DataFrame(registry_stats()), hide_index=True)
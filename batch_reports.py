@@ -0,0 +1,164 @@
+"""
+Headless batch PDF reports.
+
+Parses an expense CSV (or several, or zip archives of them) once with the
+dashboard's loader, then writes one report per Region, Trainer or Client,
+spread across a process pool.
+
+Usage:
+    python batch_reports.py data.csv --by region --out reports
+    python batch_reports.py north.csv south.csv march.zip --by client
+    python batch_reports.py data.csv --by trainer --workers 8 --orientation Landscape
+"""
+import argparse
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from io import BytesIO
+from aggregation import build_cube, cube_inputs
+from caching import content_hash
+from chart_generator import LazyCharts, DEFAULT_COLOR_SEQUENCE, DEFAULT_TEMPLATE
+from data_loader import (Dataset, read_expense_csv, stream_expense_csv, expand_uploads, read_expense_files,
+                         stream_expense_files, MissingColumnsError)
+from pdf_generator import generate_expense_report, warm_up, CHART_BACKENDS
+
+GROUP_COLUMNS = {
+    'region': 'Region',
+    'trainer': 'Name of Trainer',
+    'client': 'Client Name',
+}
+
+SECTIONS = ['kpi', 'region', 'trainer', 'client', 'payment']
+
+
+def report_filename(group, value, used=None):
+    """
+    File name for one group's report, safe on every platform. Names already
+    in `used` (compared case-insensitively) get a short hash of the value,
+    so values that differ only in punctuation do not overwrite each other.
+    """
+    slug = re.sub(r'[^\w.-]+', '_', str(value)).strip('_') or 'blank'
+    name = f"expense_report_{group}_{slug}.pdf"
+    if used is not None:
+        if name.lower() in used:
+            name = f"expense_report_{group}_{slug}_{content_hash(str(value).encode('utf-8'))[:8]}.pdf"
+        used.add(name.lower())
+    return name
+
+
+def build_report(cube, options, path):
+    """Renders one report from its cube and writes it to `path`. Runs in a worker process."""
+    start = time.perf_counter()
+    charts = None
+    if options['chart_backend'] == 'plotly':
+        charts = LazyCharts(cube, DEFAULT_COLOR_SEQUENCE, DEFAULT_TEMPLATE)
+    pdf_bytes = generate_expense_report(cube, options, charts)
+    with open(path, 'wb') as f:
+        f.write(pdf_bytes)
+    return time.perf_counter() - start
+
+
+def load_rows(paths, stream=False):
+    """
+    Parses the input files into cleaned rows, or into a cube if streaming.
+    Several files (or a zip archive) are combined with a 'Source File' column.
+    """
+    if len(paths) == 1 and not paths[0].lower().endswith('.zip'):
+        if stream:
+            return stream_expense_csv(paths[0])
+        with open(paths[0], 'rb') as f:
+            return read_expense_csv(f.read())
+
+    files = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            files.append((os.path.basename(path), f.read()))
+    files = expand_uploads(files)
+    if stream:
+        return stream_expense_files([(name, BytesIO(file_bytes)) for name, file_bytes in files])
+    return read_expense_files(files)
+
+
+def report_jobs(dataset, group):
+    """Yields (value, cube) for every value of the grouping column."""
+    column = GROUP_COLUMNS[group]
+    all_rows = dataset.index.all_rows()
+    for value in dataset.index.values(column, all_rows):
+        rows = dataset.index.select(column, [value], all_rows)
+        yield value, build_cube(rows.apply(dataset.df, cube_inputs(dataset.df)))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate one expense PDF report per Region, Trainer or Client.")
+    parser.add_argument('csv', nargs='+', help="Expense CSV exports (L&D onsite visit plans) or zip archives of them")
+    parser.add_argument('--by', choices=sorted(GROUP_COLUMNS), default='region', help="Report grouping (default: region)")
+    parser.add_argument('--out', default='reports', help="Output directory (default: reports)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Worker processes (default: CPU count)")
+    parser.add_argument('--stream', action='store_true', help="Stream the CSV in chunks (for files larger than RAM)")
+    parser.add_argument('--page-size', default='A4', choices=["A0", "A1", "A2", "A3", "A4", "A5", "A6", "Letter", "Legal"])
+    parser.add_argument('--orientation', default='Portrait', choices=['Portrait', 'Landscape'])
+    parser.add_argument('--chart-backend', default='plotly', choices=CHART_BACKENDS,
+                        help="Chart renderer: plotly (Kaleido) or reportlab (native, no browser)")
+    parser.add_argument('--no-cover', action='store_true', help="Leave out the cover page")
+    parser.add_argument('--sections', default=','.join(SECTIONS),
+                        help=f"Comma-separated sections to include (default: {','.join(SECTIONS)})")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    sections = {s.strip() for s in args.sections.split(',') if s.strip()}
+    unknown = sections - set(SECTIONS)
+    if unknown:
+        print(f"Unknown sections: {', '.join(sorted(unknown))}", file=sys.stderr)
+        return 2
+
+    options = {
+        'page_size': args.page_size,
+        'orientation': args.orientation,
+        'chart_backend': args.chart_backend,
+        'include_cover': not args.no_cover,
+    }
+    for section in SECTIONS:
+        options[f'include_{section}'] = section in sections
+
+    # Parse the data once, in the parent process
+    start = time.perf_counter()
+    try:
+        df = load_rows(args.csv, args.stream)
+    except (MissingColumnsError, ValueError) as e:
+        print(e, file=sys.stderr)
+        return 2
+    dataset = Dataset(','.join(os.path.basename(path) for path in args.csv), df)
+    print(f"Loaded {', '.join(args.csv)} in {time.perf_counter() - start:.2f}s")
+
+    os.makedirs(args.out, exist_ok=True)
+    batch_start = time.perf_counter()
+    failures = 0
+    # Each worker process sets up fonts, styles and (for Plotly charts) Kaleido once,
+    # before its first report
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=warm_up,
+                             initargs=(options['chart_backend'] == 'plotly',)) as pool:
+        futures = {}
+        filenames = set()
+        for value, cube in report_jobs(dataset, args.by):
+            path = os.path.join(args.out, report_filename(args.by, value, filenames))
+            futures[pool.submit(build_report, cube, options, path)] = (value, path)
+
+        for done, future in enumerate(as_completed(futures), start=1):
+            value, path = futures[future]
+            try:
+                seconds = future.result()
+                print(f"[{done}/{len(futures)}] {value}: {seconds:.2f}s -> {path}")
+            except Exception as e:
+                failures += 1
+                print(f"[{done}/{len(futures)}] {value}: FAILED ({e})", file=sys.stderr)
+
+    print(f"Generated {len(futures) - failures} of {len(futures)} reports in {time.perf_counter() - batch_start:.2f}s")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,184 @@
+"""
+Benchmarks the dashboard's data path at several data sizes.
+
+Times loading an upload (parsed in memory, and streamed into a cube),
+indexing, sidebar filtering, the aggregation cube (with pandas and, if
+duckdb is installed, the SQL backend), the summary tables, each
+generate_*_charts function and generate_expense_report, on synthetic visit
+plans from generate_sample_data.py or on your own CSVs.
+Each stage reports the best of --repeat runs. The dataset cache and the
+chart image caches are emptied before every run, so repeats do the full
+work instead of returning cached results.
+
+Usage:
+    python benchmark.py --rows 1000,100000,1000000
+    python benchmark.py --csv my_export.csv --json results.json
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+import data_loader
+import pdf_generator
+from caching import DiskCache
+from chart_generator import (DEFAULT_COLOR_SEQUENCE, DEFAULT_TEMPLATE, generate_region_charts,
+                             generate_trainer_charts, generate_client_charts, generate_payment_charts)
+from data_loader import load_files
+from filters import InvertedIndex, date_bounds, date_range_positions, RowSelection
+from aggregation import build_cube, kpi_summary, region_summary, trainer_summary, client_summary, payment_pivot
+from pdf_generator import generate_expense_report, CHART_BACKENDS
+from sql_backend import SQLBackend, duckdb_available
+from generate_sample_data import write_sample_csv
+
+
+def best_time(fn, repeat, setup=None):
+    """
+    Runs `fn` `repeat` times, each after an untimed call to `setup` if
+    given; returns (best seconds, last result).
+    """
+    best, result = float('inf'), None
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def clear_datasets():
+    """Empties the dataset cache, so every load parses and indexes the upload again."""
+    data_loader._dataset_cache.clear()
+
+
+def clear_chart_images(directory):
+    """
+    Empties the PNG caches, with the disk cache moved to `directory`, so a
+    Plotly PDF run rasterizes every chart instead of reading cached PNGs.
+    """
+    shutil.rmtree(directory, ignore_errors=True)
+    pdf_generator._png_memory_cache.clear()
+    pdf_generator._png_disk_cache = DiskCache(directory, pdf_generator._png_disk_cache.max_bytes, suffix='.png')
+
+
+def sidebar_selection(df, index):
+    """
+    The rows a typical sidebar selection keeps: the last 90 days, the top
+    regions and trainers. Returns (rows, (start_date, end_date, filters)).
+    """
+    start_date, end_date = date_bounds(df)
+    start_date = max(start_date, end_date - timedelta(days=90))
+    rows = RowSelection(*date_range_positions(df, start_date, end_date))
+    filters = []
+    for column in ('Region', 'Name of Trainer'):
+        values = index.values(column, rows)
+        values = values[:max(1, len(values) // 2)]
+        rows = index.select(column, values, rows)
+        filters.append((column, values))
+    return rows, (start_date, end_date, filters)
+
+
+def run_benchmark(file_bytes, repeat, chart_backend='reportlab', pdf=True, sql=True):
+    """Times every stage on one CSV; returns {stage: seconds}."""
+    timings = {}
+    files = [('upload.csv', file_bytes)]
+    timings['load'], dataset = best_time(lambda: load_files(files, streaming=False), repeat, clear_datasets)
+    timings['load_stream'], _ = best_time(lambda: load_files(files, streaming=True), repeat, clear_datasets)
+    clear_datasets()
+    df = dataset.df
+    timings['index'], index = best_time(lambda: InvertedIndex(df), repeat)
+    timings['filter'], (rows, query) = best_time(lambda: sidebar_selection(df, index), repeat)
+    filtered_df = rows.apply(df)
+    timings['cube'], cube = best_time(lambda: build_cube(filtered_df), repeat)
+
+    if sql and duckdb_available():
+        with tempfile.TemporaryDirectory() as tmp:
+            timings['sql_copy'], backend = best_time(
+                lambda: SQLBackend.from_frame(df, os.path.join(tmp, 'rows.parquet')), 1)
+            timings['cube_sql'], _ = best_time(lambda: backend.cube(*query), repeat)
+            backend.close()
+
+    timings['tables'], _ = best_time(lambda: (
+        kpi_summary(cube), region_summary(cube), trainer_summary(cube),
+        client_summary(cube), payment_pivot(cube)
+    ), repeat)
+
+    charts = {}
+    for name, generate in (('region', generate_region_charts), ('trainer', generate_trainer_charts),
+                           ('client', generate_client_charts), ('payment', generate_payment_charts)):
+        timings[f'charts_{name}'], figures = best_time(
+            lambda: generate(cube, DEFAULT_COLOR_SEQUENCE, DEFAULT_TEMPLATE), repeat)
+        charts.update(figures)
+
+    if pdf:
+        options = {'chart_backend': chart_backend}
+        png_disk_cache = pdf_generator._png_disk_cache
+        with tempfile.TemporaryDirectory() as tmp:
+            try:
+                timings['pdf'], _ = best_time(lambda: generate_expense_report(cube, options, charts), repeat,
+                                              lambda: clear_chart_images(os.path.join(tmp, 'charts')))
+            finally:
+                pdf_generator._png_disk_cache = png_disk_cache
+
+    timings['rows'] = len(df)
+    timings['filtered_rows'] = len(filtered_df)
+    timings['cube_rows'] = len(cube)
+    return timings
+
+
+def print_results(results):
+    stages = [key for key in next(iter(results.values())) if not key.endswith('rows')]
+    names = list(results)
+    width = max(12, *(len(name) for name in names))
+    print(f"{'stage':<16}" + ''.join(f"{name:>{width + 2}}" for name in names))
+    for key in ('rows', 'filtered_rows', 'cube_rows'):
+        print(f"{key:<16}" + ''.join(f"{results[name][key]:>{width + 2},}" for name in names))
+    for stage in stages:
+        print(f"{stage:<16}" + ''.join(f"{results[name][stage]:>{width + 1}.3f}s" for name in names))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark ingestion, filtering, tables, charts and the PDF report.")
+    parser.add_argument('--rows', default='1000,100000', help="Comma-separated synthetic dataset sizes (default: 1000,100000)")
+    parser.add_argument('--csv', nargs='*', default=[], help="Benchmark these CSV files instead of synthetic data")
+    parser.add_argument('--clients', type=int, default=200, help="Synthetic client count (default: 200)")
+    parser.add_argument('--trainers', type=int, default=25, help="Synthetic trainer count (default: 25)")
+    parser.add_argument('--regions', type=int, default=5, help="Synthetic region count (default: 5)")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per stage; the best is reported (default: 3)")
+    parser.add_argument('--chart-backend', default='reportlab', choices=CHART_BACKENDS,
+                        help="PDF chart renderer (default: reportlab, which needs no browser)")
+    parser.add_argument('--no-pdf', action='store_true', help="Skip the PDF report stage")
+    parser.add_argument('--no-sql', action='store_true', help="Skip the DuckDB cube stages")
+    parser.add_argument('--json', help="Also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        sources = list(args.csv)
+        if not sources:
+            for rows in (int(r) for r in args.rows.split(',') if r.strip()):
+                path = os.path.join(tmp, f'visit_plan_{rows}.csv')
+                write_sample_csv(path, rows, args.regions, args.clients, args.trainers)
+                sources.append(path)
+
+        for path in sources:
+            name = os.path.basename(path)
+            print(f"Benchmarking {name}...")
+            with open(path, 'rb') as f:
+                file_bytes = f.read()
+            results[name] = run_benchmark(file_bytes, args.repeat, args.chart_backend,
+                                          pdf=not args.no_pdf, sql=not args.no_sql)
+
+    print()
+    print_results(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
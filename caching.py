@@ -0,0 +1,167 @@
+"""
+Small caches shared across Streamlit sessions and reruns: an in-process LRU
+and a size-bounded directory of files on local disk.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+# Root directory for the on-disk caches
+CACHE_DIR = os.environ.get('EXPENSE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'expense_analysis_cache'))
+
+
+def content_hash(data):
+    """Returns the SHA-256 hex digest of `data` (bytes)."""
+    return hashlib.sha256(data).hexdigest()
+
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache holding at most `max_entries` values.
+
+    With `max_bytes`, the cache also evicts until the values' total size
+    fits: their length, for bytes-like values, or `size_of(value)`.
+    `on_evict(key, value)` is called for
+    every evicted entry. `get_or_create` builds a missing value exactly once, even when several
+    sessions ask for the same key at the same time.
+    """
+
+    def __init__(self, max_entries, max_bytes=None, on_evict=None, size_of=len):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size_of = size_of
+        self.on_evict = on_evict
+        self._size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def items(self):
+        """A snapshot of the (key, value) pairs, least recently used first."""
+        with self._lock:
+            return list(self._entries.items())
+
+    def get(self, key, default=None):
+        """Returns the cached value for `key` and marks it most recently used."""
+        with self._lock:
+            if key not in self._entries:
+                return default
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, value):
+        """Stores `value`, evicting the least recently used entries if full."""
+        evicted = []
+        with self._lock:
+            if key in self._entries:
+                self._size -= self._size_of(self._entries[key])
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            self._size += self._size_of(value)
+            while len(self._entries) > self.max_entries or (
+                    self.max_bytes is not None and self._size > self.max_bytes and len(self._entries) > 1):
+                old_key, old_value = self._entries.popitem(last=False)
+                self._size -= self._size_of(old_value)
+                evicted.append((old_key, old_value))
+        if self.on_evict is not None:
+            for old_key, old_value in evicted:
+                self.on_evict(old_key, old_value)
+
+    def _size_of(self, value):
+        return self.size_of(value) if self.max_bytes is not None else 0
+
+    def get_or_create(self, key, factory):
+        """Returns the cached value for `key`, calling `factory()` to build it on a miss."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        try:
+            with key_lock:
+                # Another session may have built it while we waited
+                with self._lock:
+                    if key in self._entries:
+                        self._entries.move_to_end(key)
+                        return self._entries[key]
+                value = factory()
+                self.put(key, value)
+                return value
+        finally:
+            with self._lock:
+                self._key_locks.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+class DiskCache:
+    """
+    Bytes cache stored as one file per key under `directory`.
+
+    Reads refresh a file's modification time, and writes evict the least
+    recently used files once the directory grows past `max_bytes`.
+    """
+
+    def __init__(self, directory, max_bytes, suffix=''):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + self.suffix)
+
+    def get(self, key):
+        """Returns the stored bytes for `key`, or None."""
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+            return data
+        except OSError:
+            return None
+
+    def put(self, key, data):
+        """Stores `data` atomically, then evicts old files if over budget."""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+        except OSError as e:
+            print(f"Error writing cache entry {key}: {e}")
+            return
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            for entry in os.scandir(self.directory):
+                if entry.is_file() and entry.name.endswith(self.suffix) and not entry.name.endswith('.tmp'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
@@ -1,13 +1,74 @@
 import plotly.express as px
 import plotly.graph_objects as go
 import pandas as pd
+import threading
+from collections.abc import Mapping
+from aggregation import as_cube, cost_by, cost_pivot, dimension_stats, client_totals, weekly_costs
+from caching import LRUCache
+from instrumentation import span
 
-def generate_region_charts(df, color_sequence, template):
-    """Generates charts for the Region Analysis tab."""
-    charts = {}
+# Dashboard-wide chart styling
+DEFAULT_COLOR_SEQUENCE = px.colors.qualitative.Plotly
+DEFAULT_TEMPLATE = "plotly_white"
+
+# High-cardinality charts keep the top N trainers/clients by cost and fold
+# the rest into OTHER_LABEL (None plots every value)
+MAX_CHART_CATEGORIES = 30
+OTHER_LABEL = 'Other'
+
+# Line/scatter traces switch to WebGL from this many (plotted, i.e. capped)
+# points, and drop their per-point text labels above TEXT_LABEL_MAX_POINTS.
+# A capped weekly trend has up to (MAX_CHART_CATEGORIES + 1) points a week.
+WEBGL_MIN_POINTS = 1000
+TEXT_LABEL_MAX_POINTS = 200
+
+def cap_categories(cube, by, max_categories=None):
+    """
+    Relabels every value of `by` outside the top `max_categories` by cost as OTHER_LABEL.
+    
+    The kept values come first in the result's category order, OTHER_LABEL last.
+    A value that is itself named OTHER_LABEL is never kept; it is merged into
+    the folded rest.
+    """
+    if max_categories is None:
+        max_categories = MAX_CHART_CATEGORIES
+    totals = cube.groupby(by, observed=True)['Cost'].sum()
+    if max_categories is None or len(totals) <= max_categories:
+        return cube
+    totals = totals[totals.index != OTHER_LABEL]
+    keep = totals.sort_values(ascending=False, kind='stable').index[:max_categories]
+    labels = cube[by].astype(object).where(cube[by].isin(keep) | cube[by].isna(), OTHER_LABEL)
+    return cube.assign(**{by: pd.Categorical(labels, categories=list(keep) + [OTHER_LABEL])})
+
+def top_rows(table, value, label_columns, max_categories=None):
+    """
+    Keeps the `max_categories` rows of `table` with the highest `value` and sums the rest into one row.
     
-    # 1. Regional Cost Distribution (Pie/Donut)
-    region_summary = df.groupby('Region')['Cost'].sum().reset_index()
+    The folded row has OTHER_LABEL in every `label_columns` column and the
+    sum of every other numeric column.
+    """
+    if max_categories is None:
+        max_categories = MAX_CHART_CATEGORIES
+    if max_categories is None or len(table) <= max_categories:
+        return table
+    table = table.sort_values(value, ascending=False, kind='stable')
+    rest = table.iloc[max_categories:]
+    other = rest.drop(columns=label_columns).sum(numeric_only=True)
+    for col in label_columns:
+        other[col] = OTHER_LABEL
+    other_row = pd.DataFrame([other])[table.columns]
+    top = table.iloc[:max_categories].astype({col: object for col in label_columns})
+    folded = pd.concat([top, other_row], ignore_index=True)
+    return folded.astype({col: table[col].dtype for col in table.columns if col not in label_columns})
+
+def _trace_options(n_points):
+    """render_mode for px.line/px.scatter and whether to draw per-point text."""
+    render_mode = 'webgl' if n_points >= WEBGL_MIN_POINTS else 'auto'
+    return render_mode, n_points <= TEXT_LABEL_MAX_POINTS
+
+def _region_pie(cube, color_sequence, template):
+    """Regional Cost Distribution (Pie/Donut)."""
+    region_summary = cost_by(cube, 'Region')
     region_summary = region_summary.sort_values('Cost', ascending=False)
     fig_pie = px.pie(
         region_summary, 
@@ -28,44 +89,44 @@ def generate_region_charts(df, color_sequence, template):
         legend=dict(orientation="v", yanchor="middle", y=0.5),
         margin=dict(l=50, r=50, t=80, b=50)
     )
-    charts['region_pie'] = fig_pie
-
-    # 2. Weekly Cost Trends by Region (Line)
-    if not df.empty:
-        temp_df = df.set_index('Date')
-        weekly_costs = temp_df.groupby('Region')['Cost'].resample('W-MON').sum().reset_index()
-        
-        fig_line = px.line(
-            weekly_costs,
-            x='Date',
-            y='Cost',
-            color='Region',
-            markers=True,
-            labels={'Cost': 'Cost (Rs.)', 'Date': 'Week'},
-            color_discrete_sequence=color_sequence,
-            template=template,
-            text='Cost',
-            title="Weekly Cost Trends by Region"
-        )
-        fig_line.update_traces(
-            textposition="top center",
-            texttemplate='%{y:.2s}',
-            textfont=dict(size=12, color='black', family='Arial'),
-            mode='lines+markers+text'
-        )
-        fig_line.update_layout(
-            hovermode="x unified",
-            margin=dict(l=50, r=50, t=80, b=50)
-        )
-        charts['region_trend'] = fig_line
-
-    # 3. Regional Cost Analysis: Total vs Average (Grouped Bar)
-    region_agg = df.groupby('Region').agg({
-        'Cost': 'sum',
-        'Session_ID': 'nunique'
-    }).reset_index()
-    region_agg['Average Session Cost'] = region_agg['Cost'] / region_agg['Session_ID']
-    region_agg.columns = ['Region', 'Total Cost', 'Session Count', 'Average Session Cost']
+    return fig_pie
+
+def _region_trend(cube, color_sequence, template):
+    """Weekly Cost Trends by Region (Line)."""
+    if cube.empty:
+        return None
+
+    weekly_region_costs = weekly_costs(cube, 'Region')
+
+    fig_line = px.line(
+        weekly_region_costs,
+        x='Date',
+        y='Cost',
+        color='Region',
+        markers=True,
+        labels={'Cost': 'Cost (Rs.)', 'Date': 'Week'},
+        color_discrete_sequence=color_sequence,
+        template=template,
+        text='Cost',
+        title="Weekly Cost Trends by Region"
+    )
+    fig_line.update_traces(
+        textposition="top center",
+        texttemplate='%{y:.2s}',
+        textfont=dict(size=12, color='black', family='Arial'),
+        mode='lines+markers+text'
+    )
+    fig_line.update_layout(
+        hovermode="x unified",
+        margin=dict(l=50, r=50, t=80, b=50)
+    )
+    return fig_line
+
+def _region_bar_group(cube, color_sequence, template):
+    """Regional Cost Analysis: Total vs Average (Grouped Bar)."""
+    region_stats = dimension_stats(cube, 'Region').reset_index()
+    region_agg = region_stats[['Region', 'Total Cost', 'Session Count']].copy()
+    region_agg['Average Session Cost'] = region_agg['Total Cost'] / region_agg['Session Count']
     region_agg = region_agg.sort_values('Total Cost', ascending=False)
     
     fig_bar_group = px.bar(
@@ -79,13 +140,12 @@ def generate_region_charts(df, color_sequence, template):
         title="Regional Cost Analysis: Total vs Average"
     )
     fig_bar_group.update_layout(margin=dict(l=50, r=50, t=80, b=50))
-    charts['region_bar_group'] = fig_bar_group
+    return fig_bar_group
 
-    # 4. Regional Activity: Sessions & Clients (Grouped Bar)
-    region_activity = df.groupby('Region').agg({
-        'Session_ID': 'nunique',
-        'Client Name': 'nunique'
-    }).reset_index()
+def _region_activity(cube, color_sequence, template):
+    """Regional Activity: Sessions & Clients (Grouped Bar)."""
+    region_stats = dimension_stats(cube, 'Region').reset_index()
+    region_activity = region_stats[['Region', 'Session Count', 'Number of Clients']]
     region_activity.columns = ['Region', 'Session Count', 'Client Count']
     region_activity = region_activity.sort_values('Session Count', ascending=False)
     
@@ -100,17 +160,15 @@ def generate_region_charts(df, color_sequence, template):
         text_auto=True
     )
     fig_region_activity.update_layout(margin=dict(l=50, r=50, t=80, b=50))
-    charts['region_activity'] = fig_region_activity
-    
-    return charts
+    return fig_region_activity
 
-def generate_trainer_charts(df, color_sequence, template):
-    """Generates charts for the Trainer Analysis tab."""
-    charts = {}
-    
-    # 1. Trainer Expenses by Payment Method (Grouped Bar)
-    trainer_payment = df.groupby(['Name of Trainer', 'Payment Type'])['Cost'].sum().reset_index()
-    trainer_order = df.groupby('Name of Trainer')['Cost'].sum().sort_values(ascending=False).index
+def _trainer_payment(cube, color_sequence, template):
+    """Trainer Expenses by Payment Method (Grouped Bar)."""
+    cube = cap_categories(cube, 'Name of Trainer')
+    trainer_payment = cost_by(cube, ['Name of Trainer', 'Payment Type'])
+    trainer_order = cube.groupby('Name of Trainer', observed=True)['Cost'].sum().sort_values(ascending=False).index
+    trainer_order = [t for t in trainer_order if t != OTHER_LABEL] + [t for t in trainer_order if t == OTHER_LABEL]
+    _, show_text = _trace_options(len(trainer_payment))
     
     fig_grouped = px.bar(
         trainer_payment,
@@ -121,23 +179,18 @@ def generate_trainer_charts(df, color_sequence, template):
         title="Trainer Expenses by Payment Method",
         color_discrete_sequence=color_sequence,
         template=template,
-        text_auto='.2s'
+        text_auto='.2s' if show_text else False
     )
     fig_grouped.update_layout(
         xaxis={'categoryorder':'array', 'categoryarray': trainer_order},
         yaxis_title="Cost (Rs.)",
         margin=dict(l=50, r=50, t=80, b=50)
     )
-    charts['trainer_payment'] = fig_grouped
+    return fig_grouped
 
-    # 2. Regional-Trainer Cost Heatmap
-    pivot_table = df.pivot_table(
-        index='Region', 
-        columns='Name of Trainer', 
-        values='Cost', 
-        aggfunc='sum',
-        fill_value=0
-    )
+def _trainer_heatmap(cube, color_sequence, template):
+    """Regional-Trainer Cost Heatmap."""
+    pivot_table = cost_pivot(cube, 'Region', 'Name of Trainer')
     fig_heatmap = go.Figure(data=go.Heatmap(
         z=pivot_table.values,
         x=pivot_table.columns,
@@ -153,18 +206,11 @@ def generate_trainer_charts(df, color_sequence, template):
         template=template,
         margin=dict(l=50, r=50, t=80, b=50)
     )
-    charts['trainer_heatmap'] = fig_heatmap
-
-    # 3. Trainer Cost Efficiency (Line)
-    trainer_stats = df.groupby('Name of Trainer').agg({
-        'Cost': 'sum',
-        'Session_ID': 'nunique',
-        'Date': lambda x: (x.max() - x.min()).days / 7 if (x.max() - x.min()).days > 0 else 1
-    })
-    trainer_stats.columns = ['Total Cost', 'Session Count', 'Weeks']
-    trainer_stats['Average Cost'] = trainer_stats['Total Cost'] / trainer_stats['Session Count']
-    trainer_stats['Average Weekly Cost'] = trainer_stats['Total Cost'] / trainer_stats['Weeks']
-    trainer_stats_plot = trainer_stats.reset_index()
+    return fig_heatmap
+
+def _trainer_efficiency(cube, color_sequence, template):
+    """Trainer Cost Efficiency (Line)."""
+    trainer_stats_plot = dimension_stats(cap_categories(cube, 'Name of Trainer'), 'Name of Trainer').reset_index()
     
     trainer_melted = trainer_stats_plot.melt(
         id_vars='Name of Trainer',
@@ -172,6 +218,7 @@ def generate_trainer_charts(df, color_sequence, template):
         var_name='Metric',
         value_name='Cost'
     )
+    render_mode, show_text = _trace_options(len(trainer_melted))
     fig_avg_comp = px.line(
         trainer_melted,
         x='Name of Trainer',
@@ -181,18 +228,23 @@ def generate_trainer_charts(df, color_sequence, template):
         title="Trainer Cost Efficiency: Avg Cost vs Weekly Cost",
         color_discrete_sequence=color_sequence,
         template=template,
-        text='Cost'
-    )
-    fig_avg_comp.update_traces(
-        textposition="top center",
-        texttemplate='%{y:.2s}',
-        textfont=dict(size=12, color='black', family='Arial'),
-        mode='lines+markers+text'
+        text='Cost' if show_text else None,
+        render_mode=render_mode
     )
+    if show_text:
+        fig_avg_comp.update_traces(
+            textposition="top center",
+            texttemplate='%{y:.2s}',
+            textfont=dict(size=12, color='black', family='Arial'),
+            mode='lines+markers+text'
+        )
     fig_avg_comp.update_layout(margin=dict(l=50, r=50, t=80, b=50))
-    charts['trainer_efficiency'] = fig_avg_comp
+    return fig_avg_comp
 
-    # 4. Trainer Expense Distribution (Donut)
+def _trainer_pie(cube, color_sequence, template):
+    """Trainer Expense Distribution (Donut)."""
+    trainer_stats_plot = dimension_stats(cube, 'Name of Trainer').reset_index()
+    trainer_stats_plot = top_rows(trainer_stats_plot[['Name of Trainer', 'Total Cost']], 'Total Cost', ['Name of Trainer'])
     fig_trainer_pie = px.pie(
         trainer_stats_plot,
         values='Total Cost',
@@ -212,52 +264,47 @@ def generate_trainer_charts(df, color_sequence, template):
         legend=dict(orientation="v", yanchor="middle", y=0.5),
         margin=dict(l=50, r=50, t=80, b=50)
     )
-    charts['trainer_pie'] = fig_trainer_pie
-
-    # 5. Weekly Cost Trends by Trainer (Line)
-    if not df.empty:
-        temp_df = df.set_index('Date')
-        weekly_trainer_costs = temp_df.groupby('Name of Trainer')['Cost'].resample('W-MON').sum().reset_index()
-        
-        fig_trainer_line = px.line(
-            weekly_trainer_costs,
-            x='Date',
-            y='Cost',
-            color='Name of Trainer',
-            markers=True,
-            labels={'Cost': 'Cost (Rs.)', 'Date': 'Week'},
-            color_discrete_sequence=color_sequence,
-            template=template,
-            text='Cost',
-            title="Weekly Cost Trends by Trainer",
-            height=600
-        )
+    return fig_trainer_pie
+
+def _trainer_trend(cube, color_sequence, template):
+    """Weekly Cost Trends by Trainer (Line)."""
+    if cube.empty:
+        return None
+
+    weekly_trainer_costs = weekly_costs(cap_categories(cube, 'Name of Trainer'), 'Name of Trainer')
+    render_mode, show_text = _trace_options(len(weekly_trainer_costs))
+
+    fig_trainer_line = px.line(
+        weekly_trainer_costs,
+        x='Date',
+        y='Cost',
+        color='Name of Trainer',
+        markers=True,
+        labels={'Cost': 'Cost (Rs.)', 'Date': 'Week'},
+        color_discrete_sequence=color_sequence,
+        template=template,
+        text='Cost' if show_text else None,
+        title="Weekly Cost Trends by Trainer",
+        height=600,
+        render_mode=render_mode
+    )
+    if show_text:
         fig_trainer_line.update_traces(
             textposition="top center",
             texttemplate='%{y:.2s}',
             textfont=dict(size=12, color='black', family='Arial'),
             mode='lines+markers+text'
         )
-        fig_trainer_line.update_layout(
-            hovermode="x unified",
-            margin=dict(l=50, r=50, t=80, b=50)
-        )
-        charts['trainer_trend'] = fig_trainer_line
-        
-    return charts
+    fig_trainer_line.update_layout(
+        hovermode="x unified",
+        margin=dict(l=50, r=50, t=80, b=50)
+    )
+    return fig_trainer_line
 
-def generate_client_charts(df, color_sequence, template):
-    """Generates charts for the Client Analysis tab."""
-    charts = {}
-    
-    client_summary = df.groupby(['Region', 'Client Name']).agg({
-        'Cost': 'sum',
-        'Session_ID': 'nunique'
-    }).reset_index()
-    client_summary.columns = ['Region', 'Client Name', 'Total Cost', 'Session Count']
-    client_summary = client_summary.sort_values('Total Cost', ascending=False)
-    
-    # 1. Client Cost Overview (Line)
+def _client_cost(cube, color_sequence, template):
+    """Client Cost Overview (Line)."""
+    client_summary = top_rows(client_totals(cube), 'Total Cost', ['Region', 'Client Name'])
+    render_mode, show_text = _trace_options(len(client_summary))
     fig_line_client = px.line(
         client_summary,
         x='Client Name',
@@ -266,19 +313,25 @@ def generate_client_charts(df, color_sequence, template):
         title="Client Cost Overview",
         color_discrete_sequence=color_sequence,
         template=template,
-        text='Total Cost',
-        height=600
-    )
-    fig_line_client.update_traces(
-        textposition="top center",
-        texttemplate='%{y:.2s}',
-        textfont=dict(size=12, color='black', family='Arial'),
-        mode='lines+markers+text'
+        text='Total Cost' if show_text else None,
+        height=600,
+        render_mode=render_mode
     )
+    if show_text:
+        fig_line_client.update_traces(
+            textposition="top center",
+            texttemplate='%{y:.2s}',
+            textfont=dict(size=12, color='black', family='Arial'),
+            mode='lines+markers+text'
+        )
     fig_line_client.update_layout(margin=dict(l=50, r=50, t=80, b=50))
-    charts['client_cost'] = fig_line_client
+    return fig_line_client
 
-    # 2. Client Session Analysis (Scatter)
+def _client_scatter(cube, color_sequence, template):
+    """Client Session Analysis (Scatter)."""
+    client_summary = top_rows(client_totals(cube), 'Total Cost', ['Region', 'Client Name'])
+    render_mode, show_text = _trace_options(len(client_summary))
+    
     fig_scatter_client = px.scatter(
         client_summary,
         x='Client Name',
@@ -289,24 +342,21 @@ def generate_client_charts(df, color_sequence, template):
         color_discrete_sequence=color_sequence,
         template=template,
         height=600,
-        text='Session Count'
-    )
-    fig_scatter_client.update_traces(
-        textposition='top center',
-        textfont=dict(size=12, color='black', family='Arial'),
-        mode='markers+text'
+        text='Session Count' if show_text else None,
+        render_mode=render_mode
     )
+    if show_text:
+        fig_scatter_client.update_traces(
+            textposition='top center',
+            textfont=dict(size=12, color='black', family='Arial'),
+            mode='markers+text'
+        )
     fig_scatter_client.update_layout(margin=dict(l=50, r=50, t=80, b=50))
-    charts['client_scatter'] = fig_scatter_client
-    
-    return charts
+    return fig_scatter_client
 
-def generate_payment_charts(df, color_sequence, template):
-    """Generates charts for the Payment Analysis tab."""
-    charts = {}
-    
-    # 1. Payment Method Distribution (Pie)
-    payment_dist = df.groupby('Payment Type')['Cost'].sum().reset_index()
+def _payment_pie(cube, color_sequence, template):
+    """Payment Method Distribution (Pie)."""
+    payment_dist = cost_by(cube, 'Payment Type')
     payment_dist = payment_dist.sort_values('Cost', ascending=False)
     
     fig_payment = px.pie(
@@ -328,10 +378,11 @@ def generate_payment_charts(df, color_sequence, template):
         legend=dict(orientation="v", yanchor="middle", y=0.5),
         margin=dict(l=50, r=50, t=80, b=50)
     )
-    charts['payment_pie'] = fig_payment
+    return fig_payment
 
-    # 2. Payment Methods by Region (Stacked Bar)
-    region_payment = df.groupby(['Region', 'Payment Type'])['Cost'].sum().reset_index()
+def _payment_stack(cube, color_sequence, template):
+    """Payment Methods by Region (Stacked Bar)."""
+    region_payment = cost_by(cube, ['Region', 'Payment Type'])
     
     fig_pay_stack = px.bar(
         region_payment,
@@ -345,6 +396,115 @@ def generate_payment_charts(df, color_sequence, template):
         text_auto='.2s'
     )
     fig_pay_stack.update_layout(margin=dict(l=50, r=50, t=80, b=50))
-    charts['payment_stack'] = fig_pay_stack
-    
+    return fig_pay_stack
+
+# Chart key -> builder. A builder returns None when its chart has nothing to show.
+CHART_BUILDERS = {
+    'region_pie': _region_pie,
+    'region_trend': _region_trend,
+    'region_bar_group': _region_bar_group,
+    'region_activity': _region_activity,
+    'trainer_payment': _trainer_payment,
+    'trainer_heatmap': _trainer_heatmap,
+    'trainer_efficiency': _trainer_efficiency,
+    'trainer_pie': _trainer_pie,
+    'trainer_trend': _trainer_trend,
+    'client_cost': _client_cost,
+    'client_scatter': _client_scatter,
+    'payment_pie': _payment_pie,
+    'payment_stack': _payment_stack,
+}
+
+# Chart keys shown on each dashboard tab, in display order
+TAB_CHARTS = {
+    'region': ['region_pie', 'region_trend', 'region_bar_group', 'region_activity'],
+    'trainer': ['trainer_payment', 'trainer_heatmap', 'trainer_efficiency', 'trainer_pie', 'trainer_trend'],
+    'client': ['client_cost', 'client_scatter'],
+    'payment': ['payment_pie', 'payment_stack'],
+}
+
+def _build_charts(df, keys, color_sequence, template):
+    """Builds the charts for `keys`, skipping any with nothing to show."""
+    cube = as_cube(df)
+    charts = {}
+    for key in keys:
+        with span(f'chart:{key}', rows_in=len(cube)):
+            fig = CHART_BUILDERS[key](cube, color_sequence, template)
+        if fig is not None:
+            charts[key] = fig
     return charts
+
+def generate_region_charts(df, color_sequence, template):
+    """Generates charts for the Region Analysis tab."""
+    return _build_charts(df, TAB_CHARTS['region'], color_sequence, template)
+
+def generate_trainer_charts(df, color_sequence, template):
+    """Generates charts for the Trainer Analysis tab."""
+    return _build_charts(df, TAB_CHARTS['trainer'], color_sequence, template)
+
+def generate_client_charts(df, color_sequence, template):
+    """Generates charts for the Client Analysis tab."""
+    return _build_charts(df, TAB_CHARTS['client'], color_sequence, template)
+
+def generate_payment_charts(df, color_sequence, template):
+    """Generates charts for the Payment Analysis tab."""
+    return _build_charts(df, TAB_CHARTS['payment'], color_sequence, template)
+
+class LazyCharts(Mapping):
+    """
+    Read-only chart mapping that builds each figure on first access.
+
+    The dashboard tabs and the PDF report look charts up by key, so only the
+    figures that are actually displayed or exported get built. Safe to share
+    between sessions and the report workers: each figure is built once.
+    """
+
+    def __init__(self, df, color_sequence, template):
+        self.cube = as_cube(df)
+        self.color_sequence = color_sequence
+        self.template = template
+        self._figures = {}
+        self._lock = threading.Lock()
+
+    def __getitem__(self, key):
+        if key not in CHART_BUILDERS:
+            raise KeyError(key)
+        with self._lock:
+            if key not in self._figures:
+                with span(f'chart:{key}', rows_in=len(self.cube)):
+                    self._figures[key] = CHART_BUILDERS[key](self.cube, self.color_sequence, self.template)
+        if self._figures[key] is None:
+            raise KeyError(key)
+        return self._figures[key]
+
+    def __iter__(self):
+        return (key for key in CHART_BUILDERS if key in self)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def approx_bytes(self):
+        """Rough memory held: the cube, plus a capped figure for every chart."""
+        return int(self.cube.memory_usage(deep=True).sum()) + FIGURE_BYTES * len(CHART_BUILDERS)
+
+
+# Chart sets kept across reruns and sessions, keyed by filter state and styling.
+# Each pins its cube, so the cache is bounded by their approximate size too.
+CHART_CACHE_ENTRIES = 16
+CHART_CACHE_BYTES = 256 * 1024 * 1024
+
+# Allowance per built figure; categories are capped, so figures stay small
+FIGURE_BYTES = 256 * 1024
+
+_chart_cache = LRUCache(CHART_CACHE_ENTRIES, max_bytes=CHART_CACHE_BYTES, size_of=LazyCharts.approx_bytes)
+
+
+def cached_charts(state_key, make_cube, color_sequence, template):
+    """
+    LazyCharts for the filter state `state_key` (see filters.filter_fingerprint),
+    reused for as long as it, the colors and the template stay the same, so
+    reruns that only change other widgets rebuild neither the cube nor any
+    figure. `make_cube()` builds the state's cube on a cache miss.
+    """
+    key = (state_key, tuple(color_sequence), template)
+    return _chart_cache.get_or_create(key, lambda: LazyCharts(make_cube(), color_sequence, template))
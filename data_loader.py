@@ -0,0 +1,556 @@
+"""
+CSV ingestion and cleaning for the L&D onsite visit exports.
+
+Cleaned datasets are sorted by Date and cached per server process, keyed
+by a hash of the uploaded bytes, so widget reruns never re-parse a file that
+was already loaded. This cache is the registry of shared datasets: every
+session that uploads the same bytes reads the same read-only frame, and
+keeps only its own row selection of it (see filters.RowSelection). Cached
+frames must never be mutated.
+
+Files are parsed by Arrow's multi-threaded CSV reader. Only the
+REQUIRED_COLUMNS are read unless all columns are asked for, and they are
+stored compactly: dimensions as categoricals (dictionary-encoded by the
+parser), other text as Arrow strings, Cost as float32 whenever that is
+lossless.
+
+Files too large to hold as rows can be streamed instead: they are read in
+chunks that are folded into the aggregation cube, while the raw rows are
+spilled to a Parquet file for the Detailed Data tab.
+
+Several CSVs (or zip archives of them) can be loaded together: they are
+parsed in parallel and concatenated, with a SOURCE_COLUMN naming each row's
+file.
+"""
+import os
+import threading
+import uuid
+import weakref
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+import pandas as pd
+from pandas.api.types import union_categoricals
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.dataset as pds
+import pyarrow.parquet as pq
+from caching import CACHE_DIR, LRUCache, content_hash
+from filters import InvertedIndex
+from aggregation import CUBE_DIMENSIONS, ROW_COUNT
+from sql_backend import SQLBackend
+from instrumentation import span
+
+REQUIRED_COLUMNS = ['Date', 'Region', 'Client Name', 'Cost', 'Name of Trainer', 'Payment Type']
+
+# Low-cardinality text columns stored dictionary-encoded
+DIMENSION_COLUMNS = ['Region', 'Client Name', 'Name of Trainer', 'Payment Type']
+
+# Whole-rupee costs are exact in float32 below this (24-bit mantissa)
+FLOAT32_EXACT_LIMIT = 2 ** 24
+
+# Compact storage for Cost, and the full-width type its sums use
+COMPACT_COST_DTYPES = {'float64': 'float32', 'int64': 'int32'}
+
+# Strings read as missing values, the same as pd.read_csv's defaults
+NA_STRINGS = ['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+              '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null']
+
+# Parsed uploads kept in memory; the least recently used file is evicted first
+MAX_CACHED_DATASETS = 4
+
+# Uploads at least this large are streamed into a cube instead of loaded as rows
+STREAMING_THRESHOLD_BYTES = 256 * 1024 * 1024
+STREAM_CHUNK_ROWS = 250_000
+
+# Number of chunk cubes collected before they are folded together
+_FOLD_EVERY = 8
+
+SPILL_DIR = os.path.join(CACHE_DIR, 'spill')
+
+# Column naming the uploaded file of each row, when several files are loaded
+SOURCE_COLUMN = 'Source File'
+
+# Files parsed at once when several are uploaded
+PARSE_WORKERS = 4
+
+
+class Dataset:
+    """
+    A cleaned upload together with its filter index, keyed by content hash.
+
+    `df` holds the raw rows, or for a streamed upload the aggregation cube,
+    with the raw rows in the Parquet file at `spill_path`.
+
+    Sessions may keep using a dataset after the cache has evicted it, so its
+    files are only removed once it is garbage collected (or at exit).
+    """
+
+    def __init__(self, key, df, spill_path=None, all_columns=False):
+        self.key = key
+        self.df = df
+        self.spill_path = spill_path
+        self.all_columns = all_columns
+        if spill_path is not None:
+            weakref.finalize(self, _remove_file, spill_path)
+        with span('load:index', rows_in=len(df)):
+            self.index = InvertedIndex(df)
+        self._sql_backend = None
+        self._sql_lock = threading.Lock()
+
+    @property
+    def streamed(self):
+        return self.spill_path is not None
+
+    def sql_backend(self):
+        """The dataset's SQLBackend (DuckDB over a Parquet copy of `df`), created on first use."""
+        with self._sql_lock:
+            if self._sql_backend is None:
+                os.makedirs(SPILL_DIR, exist_ok=True)
+                with span('load:parquet_copy', rows_in=len(self.df)):
+                    self._sql_backend = SQLBackend.from_frame(self.df, _spill_file(self.key, '_sql.parquet'))
+            return self._sql_backend
+
+
+def _spill_file(key, suffix):
+    """
+    A new file path under SPILL_DIR for dataset `key`. Each Dataset gets its
+    own files, so a re-upload never touches those of an evicted copy.
+    """
+    os.makedirs(SPILL_DIR, exist_ok=True)
+    return os.path.join(SPILL_DIR, f"{key.replace(':', '_')}_{uuid.uuid4().hex[:12]}{suffix}")
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+# Evicting a dataset only drops the cache's reference; see Dataset
+_dataset_cache = LRUCache(MAX_CACHED_DATASETS)
+
+
+class MissingColumnsError(ValueError):
+    """Raised when an upload lacks one of the REQUIRED_COLUMNS."""
+
+    def __init__(self, missing, available, source=None):
+        self.missing = missing
+        self.available = available
+        self.source = source
+        name = 'The uploaded file' if source is None else source
+        super().__init__(f"{name} is missing the following required columns: {', '.join(missing)}")
+
+
+def _clean_rows(df):
+    """Strips headers, validates columns, parses Date/Cost and drops invalid rows."""
+    # The user's CSV has headers like 'Date ' with a trailing space
+    df.columns = df.columns.str.strip()
+
+    missing_columns = [col for col in REQUIRED_COLUMNS if col not in df.columns]
+    if missing_columns:
+        raise MissingColumnsError(missing_columns, df.columns.tolist())
+
+    # Handle potential mixed formats in Date column
+    with span('load:parse_dates', rows_in=len(df)):
+        df['Date'] = pd.to_datetime(df['Date'], errors='coerce', dayfirst=True)
+    with span('load:parse_costs', rows_in=len(df)):
+        df['Cost'] = pd.to_numeric(df['Cost'], errors='coerce')
+
+    # Drop rows with missing essential data
+    return df.dropna(subset=['Date', 'Cost'])
+
+
+def _index_rows(df):
+    """Sorts by Date, dictionary-encodes the dimensions and adds Session_ID."""
+    # Keep rows in Date order so date ranges are contiguous slices
+    df = df.sort_values('Date', kind='stable')
+
+    for col in DIMENSION_COLUMNS:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            # Categories of rows dropped while cleaning would linger in the options
+            df[col] = df[col].cat.remove_unused_categories()
+        else:
+            df[col] = df[col].astype('category')
+
+    # A "Session" is defined as a unique combination of Date and Client Name.
+    df['Session_ID'] = session_ids(df['Date'], df['Client Name'])
+    return df
+
+
+def _compact_costs(df):
+    """
+    Stores Cost as float32 (or int32) when every value survives the round
+    trip, e.g. whole rupees below FLOAT32_EXACT_LIMIT. Sums are taken at
+    full width by aggregation.build_cube.
+    """
+    cost = df['Cost'].to_numpy()
+    compact_dtype = COMPACT_COST_DTYPES.get(str(cost.dtype))
+    if compact_dtype is None or len(cost) == 0:
+        return df
+    if compact_dtype == 'float32' and not abs(cost).max() < FLOAT32_EXACT_LIMIT:
+        return df
+    compact = cost.astype(compact_dtype)
+    if (compact == cost).all():
+        df['Cost'] = compact
+    return df
+
+
+def clean_expense_data(df):
+    """Strips headers, parses Date/Cost, drops invalid rows and adds Session_ID."""
+    with span('load:clean', rows_in=len(df)) as s:
+        df = _clean_rows(df)
+        s.rows_out = len(df)
+    with span('load:sort_encode', rows_in=len(df)):
+        df = _index_rows(df)
+    return _compact_costs(df)
+
+
+def session_ids(dates, clients):
+    """
+    Integer session key for each (Date, Client Name) pair.
+
+    Rows without a client get no session (<NA>), matching the old
+    string key, which was NaN for them and so ignored by nunique().
+    """
+    date_codes, _ = pd.factorize(dates)
+    client_codes, client_values = pd.factorize(clients)
+    ids = date_codes.astype('int64') * len(client_values) + client_codes
+    dtype = 'Int32' if len(ids) == 0 or ids.max() < 2 ** 31 else 'Int64'
+    return pd.Series(ids, index=dates.index, dtype=dtype).mask(client_codes < 0)
+
+
+def _header_row(first_line):
+    """Header row index: 1 if the first line looks like metadata (mostly empty)."""
+    if isinstance(first_line, bytes):
+        first_line = first_line.decode('utf-8')
+    return 1 if first_line.startswith(',,,,,') else 0
+
+
+def _read_options(source, header, all_columns=False):
+    """
+    usecols/dtype arguments for pd.read_csv, keyed by the file's own header
+    names (which may carry trailing spaces, like 'Date ').
+
+    Raises MissingColumnsError before any data is parsed.
+    """
+    columns = pd.read_csv(source, header=header, nrows=0).columns
+    stripped = [str(col).strip() for col in columns]
+    missing = [col for col in REQUIRED_COLUMNS if col not in stripped]
+    if missing:
+        raise MissingColumnsError(missing, stripped)
+
+    options = {'dtype': {col: 'category' for col, name in zip(columns, stripped) if name in DIMENSION_COLUMNS}}
+    if not all_columns:
+        options['usecols'] = [col for col, name in zip(columns, stripped) if name in REQUIRED_COLUMNS]
+    return options
+
+
+def _read_csv_arrow(file_bytes, header, options):
+    """
+    Reads a CSV like pd.read_csv(..., **options) with Arrow's multi-threaded
+    parser. Dimension columns are dictionary-encoded while parsing and come
+    back as categoricals, with categories sorted like the C parser's.
+    """
+    column_types = {col: pa.dictionary(pa.int32(), pa.string()) for col in options['dtype']}
+    read_options = pacsv.ReadOptions(skip_rows=header)
+
+    def read():
+        convert_options = pacsv.ConvertOptions(
+            include_columns=options.get('usecols', []),
+            column_types=column_types,
+            null_values=NA_STRINGS,
+            strings_can_be_null=True,
+        )
+        return pacsv.read_csv(BytesIO(file_bytes), read_options=read_options, convert_options=convert_options)
+
+    table = read()
+    # Arrow infers ISO dates and times where pandas keeps the text (Date is
+    # parsed day-first while cleaning); read such columns again as text
+    temporal = [field.name for field in table.schema if pa.types.is_temporal(field.type)]
+    if temporal:
+        column_types.update({col: pa.string() for col in temporal})
+        table = read()
+
+    df = table.to_pandas()
+    for col in options['dtype']:
+        df[col] = df[col].cat.set_categories(df[col].cat.categories.sort_values())
+    return df
+
+
+def _parse_csv(file_bytes, all_columns=False):
+    """Reads the rows of an uploaded CSV, skipping the leading metadata row if present."""
+    header = _header_row(file_bytes.split(b'\n', 1)[0])
+    options = _read_options(BytesIO(file_bytes), header, all_columns)
+    try:
+        return _read_csv_arrow(file_bytes, header, options)
+    except pa.ArrowInvalid:
+        # Arrow is stricter than pandas (e.g. about ragged rows); let pandas try
+        return pd.read_csv(BytesIO(file_bytes), header=header, **options)
+
+
+def read_expense_csv(file_bytes, all_columns=False):
+    """
+    Parses and cleans an uploaded CSV, skipping the leading metadata row if present.
+
+    Only the REQUIRED_COLUMNS are kept unless `all_columns` is set.
+    """
+    with span('load:read_csv') as s:
+        df = _parse_csv(file_bytes, all_columns)
+        s.rows_out = len(df)
+    return clean_expense_data(df)
+
+
+def expand_uploads(files):
+    """
+    Returns (name, bytes) for every CSV among `files`, a list of (name, bytes).
+
+    Zip archives are replaced by the CSVs they contain, named like
+    'archive.zip/member.csv'.
+    """
+    expanded = []
+    for name, file_bytes in files:
+        if name.lower().endswith('.zip'):
+            with zipfile.ZipFile(BytesIO(file_bytes)) as archive:
+                for member in archive.infolist():
+                    if member.is_dir() or member.filename.startswith('__MACOSX/'):
+                        continue
+                    if member.filename.lower().endswith('.csv'):
+                        expanded.append((f'{name}/{member.filename}', archive.read(member)))
+        else:
+            expanded.append((name, file_bytes))
+    if not expanded:
+        raise ValueError("No CSV files were found in the upload.")
+    return expanded
+
+
+def _read_source(name, file_bytes, all_columns):
+    """Parses and cleans the rows of one of several files, tagged with SOURCE_COLUMN."""
+    try:
+        df = _clean_rows(_parse_csv(file_bytes, all_columns))
+    except MissingColumnsError as e:
+        raise MissingColumnsError(e.missing, e.available, source=name) from None
+    df[SOURCE_COLUMN] = pd.Categorical([name] * len(df))
+    return df
+
+
+def _concat_frames(frames):
+    """Concatenates cleaned frames, merging the categories of their categorical columns."""
+    frames = list(frames)
+    for col in frames[0].columns:
+        if all(col in df.columns and isinstance(df[col].dtype, pd.CategoricalDtype) for df in frames):
+            categories = union_categoricals([df[col] for df in frames], sort_categories=True).categories
+            frames = [df.assign(**{col: df[col].cat.set_categories(categories)}) for df in frames]
+    return pd.concat(frames, ignore_index=True)
+
+
+def read_expense_files(files, all_columns=False, max_workers=PARSE_WORKERS):
+    """
+    Parses several CSVs in parallel into one cleaned dataset.
+
+    Args:
+        files: List of (name, bytes), e.g. from expand_uploads.
+        all_columns (bool): Keep every column, not just the REQUIRED_COLUMNS.
+        max_workers (int): Files parsed at once.
+
+    Returns:
+        pd.DataFrame: The rows of all files, cleaned like read_expense_csv,
+        with the file each row came from in SOURCE_COLUMN.
+    """
+    with span('load:read_files', rows_in=len(files)) as s:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(files)))) as pool:
+            frames = list(pool.map(lambda file: _read_source(*file, all_columns), files))
+        df = _concat_frames(frames)
+        s.rows_out = len(df)
+    with span('load:sort_encode', rows_in=len(df)):
+        df = _index_rows(df)
+    return _compact_costs(df)
+
+
+def _fold_cubes(partials):
+    """Adds up chunk cubes (indexed by CUBE_DIMENSIONS) into one."""
+    combined = pd.concat(partials)
+    return combined.groupby(level=CUBE_DIMENSIONS, observed=True, dropna=False).sum()
+
+
+def _spill_table(chunk, schema):
+    """Converts a cleaned chunk to Arrow with text columns as strings."""
+    # Files of one upload may differ in their extra columns; follow the first
+    chunk = chunk.copy() if schema is None else chunk.reindex(columns=schema.names)
+    for col in chunk.columns:
+        if col not in ('Date', 'Cost'):
+            chunk[col] = chunk[col].astype('string')
+    table = pa.Table.from_pandas(chunk, preserve_index=False)
+    return table if schema is None else table.cast(schema)
+
+
+def _csv_chunks(source, chunksize, all_columns):
+    """Yields the cleaned rows of a CSV (path or binary file-like object), chunk by chunk."""
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            header = _header_row(f.readline())
+            f.seek(0)
+            options = _read_options(f, header, all_columns)
+    else:
+        header = _header_row(source.readline())
+        source.seek(0)
+        options = _read_options(source, header, all_columns)
+        source.seek(0)
+
+    for chunk in pd.read_csv(source, header=header, chunksize=chunksize, **options):
+        yield _clean_rows(chunk)
+
+
+def stream_expense_csv(source, spill_path=None, chunksize=STREAM_CHUNK_ROWS, all_columns=False):
+    """
+    Streams a CSV into an aggregation cube without keeping its rows in memory.
+
+    Each chunk gets the same cleaning as read_expense_csv and is folded into
+    running per-cell totals. If `spill_path` is given, the cleaned raw rows
+    are written there as Parquet.
+
+    Args:
+        source: File path or binary file-like object.
+        spill_path (str): Optional Parquet file for the raw rows.
+        chunksize (int): Rows parsed per chunk.
+        all_columns (bool): Spill every column, not just the REQUIRED_COLUMNS.
+
+    Returns:
+        pd.DataFrame: The cube, sorted by Date, with categorical dimensions
+        and Session_ID, ready to be filtered like raw rows.
+    """
+    return stream_expense_files([(None, source)], spill_path, chunksize, all_columns)
+
+
+def stream_expense_files(sources, spill_path=None, chunksize=STREAM_CHUNK_ROWS, all_columns=False):
+    """
+    Streams several CSVs, one after another, into a single aggregation cube.
+
+    `sources` is a list of (name, source) pairs, with sources as accepted by
+    stream_expense_csv. Spilled rows get the name in SOURCE_COLUMN, unless
+    it is None. Other arguments and the result are those of stream_expense_csv.
+    """
+    partials = []
+    writer = None
+    try:
+        for name, source in sources:
+            try:
+                for chunk in _csv_chunks(source, chunksize, all_columns):
+                    if spill_path is not None:
+                        if name is not None:
+                            chunk[SOURCE_COLUMN] = name
+                        table = _spill_table(chunk, writer.schema if writer else None)
+                        if writer is None:
+                            writer = pq.ParquetWriter(spill_path, table.schema)
+                        writer.write_table(table)
+
+                    partials.append(chunk.groupby(CUBE_DIMENSIONS, observed=True, dropna=False).agg(**{
+                        'Cost': ('Cost', 'sum'),
+                        ROW_COUNT: ('Cost', 'size'),
+                    }))
+                    if len(partials) >= _FOLD_EVERY:
+                        partials = [_fold_cubes(partials)]
+            except MissingColumnsError as e:
+                if name is None:
+                    raise
+                raise MissingColumnsError(e.missing, e.available, source=name) from None
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if partials:
+        cube = _fold_cubes(partials).reset_index()
+    else:
+        cube = pd.DataFrame(columns=CUBE_DIMENSIONS + ['Cost', ROW_COUNT])
+    return _index_rows(cube)
+
+
+def read_spilled_table(spill_path, start_date=None, end_date=None, filters=(), limit=None):
+    """
+    Reads raw rows of a streamed upload back from its Parquet spill file, as an Arrow table.
+
+    Args:
+        spill_path (str): Parquet file written by stream_expense_csv.
+        start_date, end_date (datetime.date): Inclusive date range, or None.
+        filters: (column, values) pairs; a row must match every pair.
+        limit (int): Maximum number of rows to return.
+    """
+    expression = pc.scalar(True)
+    if start_date is not None:
+        expression &= pc.field('Date') >= pd.Timestamp(start_date)
+    if end_date is not None:
+        expression &= pc.field('Date') < pd.Timestamp(end_date) + pd.Timedelta(days=1)
+    for column, values in filters:
+        expression &= pc.field(column).isin([str(v) for v in values])
+
+    dataset = pds.dataset(spill_path, format='parquet')
+    if limit is None:
+        return dataset.to_table(filter=expression)
+    return dataset.head(limit, filter=expression)
+
+
+def read_spilled_rows(spill_path, start_date=None, end_date=None, filters=(), limit=None):
+    """Same as read_spilled_table, as a DataFrame."""
+    return read_spilled_table(spill_path, start_date, end_date, filters, limit).to_pandas()
+
+
+def _stream_dataset(key, files, all_columns):
+    """Streams (name, bytes) files into a Dataset; a None name adds no SOURCE_COLUMN."""
+    spill_path = _spill_file(key, '.parquet')
+    try:
+        with span('load:stream_csv') as s:
+            sources = [(name, BytesIO(file_bytes)) for name, file_bytes in files]
+            cube = stream_expense_files(sources, spill_path, all_columns=all_columns)
+            s.rows_out = len(cube)
+    except BaseException:
+        _remove_file(spill_path)
+        raise
+    return Dataset(key, cube, spill_path=spill_path, all_columns=all_columns)
+
+
+def load_dataset(file_bytes, streaming=None, all_columns=False):
+    """
+    Returns the Dataset for an upload, parsing and indexing each distinct file once.
+
+    `streaming` selects chunked ingestion into a cube; by default it is used
+    for uploads of at least STREAMING_THRESHOLD_BYTES. `all_columns` keeps
+    the CSV's extra columns for the Detailed Data tab.
+    """
+    if streaming is None:
+        streaming = len(file_bytes) >= STREAMING_THRESHOLD_BYTES
+    key = content_hash(file_bytes) + (':all' if all_columns else '')
+    if streaming:
+        return _dataset_cache.get_or_create(key + ':streamed', lambda: _stream_dataset(key, [(None, file_bytes)], all_columns))
+    return _dataset_cache.get_or_create(key, lambda: Dataset(key, read_expense_csv(file_bytes, all_columns), all_columns=all_columns))
+
+
+def load_files(files, streaming=None, all_columns=False):
+    """
+    Returns the Dataset for an upload of several files, each combination once.
+
+    `files` is a list of (name, bytes) of CSVs and zip archives of CSVs. A
+    single CSV is loaded exactly like load_dataset; otherwise the CSVs are
+    parsed in parallel (or streamed one by one) into one dataset with a
+    SOURCE_COLUMN. Other arguments are those of load_dataset.
+    """
+    if len(files) == 1 and not files[0][0].lower().endswith('.zip'):
+        return load_dataset(files[0][1], streaming, all_columns)
+    if streaming is None:
+        streaming = sum(len(file_bytes) for _, file_bytes in files) >= STREAMING_THRESHOLD_BYTES
+    # Names are part of the data (SOURCE_COLUMN), so they are part of the key
+    listing = '\n'.join(f'{name}\t{content_hash(file_bytes)}' for name, file_bytes in files)
+    key = content_hash(listing.encode('utf-8')) + (':all' if all_columns else '')
+    if streaming:
+        return _dataset_cache.get_or_create(key + ':streamed', lambda: _stream_dataset(key, expand_uploads(files), all_columns))
+    return _dataset_cache.get_or_create(key, lambda: Dataset(key, read_expense_files(expand_uploads(files), all_columns), all_columns=all_columns))
+
+
+def registry_stats():
+    """One row per dataset in the shared, process-wide cache, least recently used first."""
+    return [{
+        'Dataset': key[:12] + (' (streamed)' if dataset.streamed else ''),
+        'Rows': len(dataset.df),
+        'Memory (MB)': round(dataset.df.memory_usage(deep=True).sum() / 2 ** 20, 1),
+    } for key, dataset in _dataset_cache.items()]
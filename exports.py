@@ -0,0 +1,181 @@
+"""
+Data downloads for the dashboard: CSV, Parquet and a multi-sheet XLSX.
+
+Downloads are built only when their button is clicked (the app passes
+callables to st.download_button). Rows are converted and written a chunk at
+a time, so no converted copy of the whole selection (e.g. a string-typed
+frame) is made. The selection itself is in memory, and the finished file is
+buffered in memory too, since the download widget is given its bytes.
+
+CSV and Parquet are written by Arrow; XLSX by XlsxWriter in its
+constant-memory mode, which is only needed for that format
+(`pip install xlsxwriter`).
+"""
+import importlib.util
+import re
+from io import BytesIO
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+
+# Rows converted and written at a time
+EXPORT_CHUNK_ROWS = 100_000
+
+PARQUET_COMPRESSION = 'zstd'
+
+# Arrow quotes the header and every string value (it has no minimal quoting)
+CSV_WRITE_OPTIONS = pacsv.WriteOptions(quoting_style='needed')
+
+# Rows per worksheet, header included
+EXCEL_MAX_ROWS = 1_048_576
+
+
+def excel_available():
+    """True if the optional xlsxwriter package is installed."""
+    return importlib.util.find_spec('xlsxwriter') is not None
+
+
+def _as_frame(data, index):
+    """`data` as a DataFrame or Arrow table, with the index as leading columns if asked for."""
+    if isinstance(data, pd.DataFrame) and index:
+        data = data.reset_index()
+        data.columns = [str(col) for col in data.columns]
+    return data
+
+
+def _whole_days(data):
+    """Names of the timestamp columns holding only whole days, written as plain dates like DataFrame.to_csv does."""
+    if isinstance(data, pd.DataFrame):
+        names = []
+        for col in data.columns:
+            if pd.api.types.is_datetime64_dtype(data[col]):
+                values = data[col].dropna()
+                if (values == values.dt.normalize()).all():
+                    names.append(col)
+        return names
+    names = []
+    for field, column in zip(data.schema, data.columns):
+        if pa.types.is_timestamp(field.type):
+            if pc.all(pc.equal(column, pc.floor_temporal(column, unit='day'))).as_py() is not False:
+                names.append(field.name)
+    return names
+
+
+def _arrow_chunks(data, chunk_rows=EXPORT_CHUNK_ROWS):
+    """
+    Yields `data` (a DataFrame or Arrow table) as Arrow tables of at most
+    `chunk_rows` rows, all with one schema: categoricals as plain strings
+    and whole-day timestamps as dates.
+    """
+    dates = set(_whole_days(data))
+    schema = None
+    for start in range(0, max(len(data), 1), chunk_rows):
+        chunk = data.iloc[start:start + chunk_rows] if isinstance(data, pd.DataFrame) else data.slice(start, chunk_rows)
+        table = pa.Table.from_pandas(chunk, preserve_index=False) if isinstance(chunk, pd.DataFrame) else chunk
+        if schema is None:
+            fields = []
+            for field in table.schema:
+                if field.name in dates:
+                    field = field.with_type(pa.date32())
+                elif pa.types.is_dictionary(field.type):
+                    field = field.with_type(field.type.value_type)
+                fields.append(field)
+            schema = pa.schema(fields)
+        yield table.cast(schema)
+
+
+def to_csv_bytes(data, index=False):
+    """
+    CSV bytes (with header) of a DataFrame or an Arrow table.
+
+    The text differs from DataFrame.to_csv: the header and all string values
+    are quoted, and whole floats are written without a decimal point (8458,
+    not 8458.0). pd.read_csv reads back the same values, though such float
+    columns come back as integers.
+    """
+    buffer = BytesIO()
+    writer = None
+    for table in _arrow_chunks(_as_frame(data, index)):
+        if writer is None:
+            writer = pacsv.CSVWriter(buffer, table.schema, write_options=CSV_WRITE_OPTIONS)
+        writer.write_table(table)
+    writer.close()
+    return buffer.getvalue()
+
+
+def to_parquet_bytes(data, index=False, compression=PARQUET_COMPRESSION):
+    """Compressed Parquet bytes of a DataFrame or an Arrow table."""
+    buffer = BytesIO()
+    writer = None
+    for table in _arrow_chunks(_as_frame(data, index)):
+        if writer is None:
+            writer = pq.ParquetWriter(buffer, table.schema, compression=compression)
+        writer.write_table(table)
+    writer.close()
+    return buffer.getvalue()
+
+
+def _sheet_name(name, used):
+    """A valid, unique worksheet name: at most 31 characters, none of []:*?/\\."""
+    base = re.sub(r'[\[\]:*?/\\]', ' ', str(name)).strip()[:31] or 'Sheet'
+    sheet, n = base, 1
+    while sheet.lower() in used:
+        n += 1
+        sheet = f'{base[:31 - len(str(n)) - 1]} {n}'
+    used.add(sheet.lower())
+    return sheet
+
+
+def _cell_writer(worksheet, arrow_type):
+    """The worksheet method writing values of `arrow_type`, skipping write()'s type checks."""
+    if pa.types.is_integer(arrow_type) or pa.types.is_floating(arrow_type):
+        def write_number(row, col, value):
+            if value == value:
+                worksheet.write_number(row, col, value)
+        return write_number
+    if pa.types.is_temporal(arrow_type):
+        return worksheet.write_datetime
+    if pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type):
+        return worksheet.write_string
+    return worksheet.write
+
+
+def to_xlsx_bytes(sheets):
+    """
+    XLSX bytes of a workbook with one worksheet per (name, data, index)
+    in `sheets`. Sheets longer than Excel allows are cut at EXCEL_MAX_ROWS.
+    """
+    import xlsxwriter
+
+    buffer = BytesIO()
+    workbook = xlsxwriter.Workbook(buffer, {
+        'constant_memory': True,
+        'default_date_format': 'yyyy-mm-dd',
+        'strings_to_numbers': False,
+        'strings_to_formulas': False,
+        'strings_to_urls': False,
+    })
+    header_format = workbook.add_format({'bold': True})
+    used = set()
+    for name, data, index in sheets:
+        worksheet = workbook.add_worksheet(_sheet_name(name, used))
+        row = 0
+        for table in _arrow_chunks(_as_frame(data, index)):
+            if row == 0:
+                worksheet.write_row(0, 0, table.column_names, header_format)
+                row = 1
+            table = table.slice(0, EXCEL_MAX_ROWS - row)
+            writers = [_cell_writer(worksheet, field.type) for field in table.schema]
+            columns = [column.to_pylist() for column in table.columns]
+            # Rows go out in order, as constant-memory mode requires; missing values stay blank
+            for values in zip(*columns):
+                for col, (write, value) in enumerate(zip(writers, values)):
+                    if value is not None:
+                        write(row, col, value)
+                row += 1
+            if row >= EXCEL_MAX_ROWS:
+                break
+    workbook.close()
+    return buffer.getvalue()
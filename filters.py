@@ -0,0 +1,128 @@
+"""
+Sidebar filter helpers operating on the cached, Date-sorted dataset.
+
+A date range is a contiguous slice of rows found by binary search. The
+multiselect filters go through an InvertedIndex built once per dataset, so
+option lists and selections never rescan or copy the whole frame.
+"""
+import numpy as np
+import pandas as pd
+from caching import content_hash
+
+INDEXED_COLUMNS = ['Region', 'Client Name', 'Name of Trainer', 'Payment Type']
+
+
+def date_bounds(df):
+    """First and last calendar day of a Date-sorted frame."""
+    return df['Date'].iloc[0].date(), df['Date'].iloc[-1].date()
+
+
+def filter_fingerprint(dataset_key, start_date, end_date, filters):
+    """
+    Hash of a filter state: the dataset's key, the date range and the
+    (column, values) filters applied. Equal states select the same rows, so
+    anything derived from those rows can be reused under this key.
+    """
+    state = (dataset_key, str(start_date), str(end_date),
+             [(column, sorted(str(value) for value in values)) for column, values in filters])
+    return content_hash(repr(state).encode('utf-8'))
+
+
+def date_range_positions(df, start_date, end_date):
+    """
+    Row positions [start, stop) of a Date-sorted frame falling on
+    start_date..end_date inclusive, found by binary search.
+    """
+    dates = df['Date']
+    start = dates.searchsorted(pd.Timestamp(start_date), side='left')
+    stop = dates.searchsorted(pd.Timestamp(end_date) + pd.Timedelta(days=1), side='left')
+    return int(start), int(stop)
+
+
+class RowSelection:
+    """Rows start..stop of a dataset, optionally narrowed by a boolean mask over that slice."""
+
+    def __init__(self, start, stop, mask=None):
+        self.start = start
+        self.stop = stop
+        self.mask = mask
+
+    def __len__(self):
+        if self.mask is None:
+            return self.stop - self.start
+        return int(self.mask.sum())
+
+    def apply(self, df, columns=None):
+        """Returns the selected rows of `df`, or of just its `columns`."""
+        if columns is not None:
+            df = df[columns]
+        rows = df.iloc[self.start:self.stop]
+        if self.mask is None:
+            return rows
+        return rows[self.mask]
+
+
+class InvertedIndex:
+    """
+    Value -> row positions index over the categorical filter columns.
+
+    For every column the row positions are stored grouped by category
+    code (missing values first), each group sorted ascending. The rows of a
+    value inside a date slice are then found by binary search, and a
+    multiselect becomes the union of those posting lists intersected with
+    the current selection.
+    """
+
+    def __init__(self, df, columns=INDEXED_COLUMNS):
+        self.n_rows = len(df)
+        self._categories = {}
+        self._codes = {}
+        self._positions = {}
+        self._offsets = {}
+        for col in columns:
+            # Shift codes by one so missing values (-1) get posting list 0
+            codes = df[col].cat.codes.to_numpy().astype(np.int64) + 1
+            n_codes = len(df[col].cat.categories) + 1
+            self._categories[col] = df[col].cat.categories
+            self._codes[col] = codes
+            self._positions[col] = np.argsort(codes, kind='stable')
+            self._offsets[col] = np.concatenate(([0], np.cumsum(np.bincount(codes, minlength=n_codes))))
+
+    def all_rows(self):
+        return RowSelection(0, self.n_rows)
+
+    def _postings(self, column, code, rows):
+        """Row positions holding `code` within rows.start..rows.stop."""
+        offsets = self._offsets[column]
+        postings = self._positions[column][offsets[code]:offsets[code + 1]]
+        lo, hi = postings.searchsorted([rows.start, rows.stop])
+        return postings[lo:hi]
+
+    def _counts(self, column, rows):
+        """Number of selected rows per (shifted) code of `column`."""
+        n_codes = len(self._offsets[column]) - 1
+        if rows.mask is None:
+            return np.array([len(self._postings(column, code, rows)) for code in range(n_codes)])
+        codes = self._codes[column][rows.start:rows.stop][rows.mask]
+        return np.bincount(codes, minlength=n_codes)
+
+    def values(self, column, rows):
+        """Sorted distinct non-missing values of `column` among the selected rows."""
+        present = np.flatnonzero(self._counts(column, rows)[1:])
+        return sorted(self._categories[column][present])
+
+    def select(self, column, values, rows):
+        """Narrows `rows` to those whose `column` is one of `values`."""
+        codes = self._categories[column].get_indexer(list(values)) + 1
+        codes = np.unique(codes[codes > 0])
+
+        # Selecting every value present (and no missing ones) keeps all rows
+        if self._counts(column, rows)[codes].sum() == len(rows):
+            return rows
+
+        bitmap = np.zeros(rows.stop - rows.start, dtype=bool)
+        for code in codes:
+            bitmap[self._postings(column, code, rows) - rows.start] = True
+        if rows.mask is not None:
+            bitmap &= rows.mask
+        return RowSelection(rows.start, rows.stop, bitmap)
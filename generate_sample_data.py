@@ -0,0 +1,138 @@
+"""
+Synthetic L&D onsite visit-plan generator.
+
+Writes CSVs with the same layout as the real export: a leading metadata row,
+headers with trailing spaces ('Date ', 'Cost '), day-first dates and a few
+invalid rows, at any size from a thousand to tens of millions of rows.
+
+Usage:
+    python generate_sample_data.py --rows 100000 --out sample_visit_plan.csv
+    python generate_sample_data.py --rows 10000000 --clients 5000 --trainers 400 --out big.csv
+"""
+import argparse
+import time
+import numpy as np
+import pandas as pd
+
+# Column headers exactly as they appear in the export
+COLUMNS = ['Sr. No.', 'Date ', 'Region', 'Client Name', 'Cost ', 'Name of Trainer', 'Payment Type', 'Remarks']
+
+REGION_NAMES = ['North', 'South', 'East', 'West', 'Central', 'North East', 'North West', 'South East', 'South West']
+PAYMENT_TYPES = ['Online', 'Cash', 'Card']
+PAYMENT_WEIGHTS = [0.55, 0.3, 0.15]
+REMARKS = ['', '', '', 'Travel', 'Stay', 'Food', 'Local conveyance']
+
+# Rows written per chunk, so memory stays flat at any size
+CHUNK_ROWS = 500_000
+
+
+def region_names(n):
+    """`n` region names, numbered once the built-in names run out."""
+    return [REGION_NAMES[i] if i < len(REGION_NAMES) else f'Region {i + 1}' for i in range(n)]
+
+
+def make_catalog(regions=5, clients=200, trainers=25, seed=42):
+    """
+    Fixed clients and trainers for a dataset: each belongs to a home region,
+    and client visit frequency follows a long-tailed (Zipf-like) distribution.
+    """
+    rng = np.random.default_rng(seed)
+    client_regions = rng.integers(0, regions, clients)
+    trainer_regions = rng.integers(0, regions, trainers)
+    popularity = 1 / np.arange(1, clients + 1) ** 0.8
+    return {
+        'regions': np.array(region_names(regions), dtype=object),
+        'clients': np.array([f'Client {i + 1:05d}' for i in range(clients)], dtype=object),
+        'client_regions': client_regions,
+        'client_weights': rng.permutation(popularity / popularity.sum()),
+        'trainers': np.array([f'Trainer {i + 1:04d}' for i in range(trainers)], dtype=object),
+        'trainer_regions': trainer_regions,
+    }
+
+
+def generate_rows(n, catalog, rng, start='2025-01-01', days=365, invalid_rate=0.001, first_sr_no=1):
+    """
+    Returns `n` visit-plan rows as a DataFrame with the export's columns.
+
+    Trainers mostly visit clients in their own region; costs are log-normal
+    and rounded to Rs. 50; visits fall on weekdays. About `invalid_rate` of
+    the rows get an unparseable Cost or Date, or a blank Client Name.
+    """
+    clients = rng.choice(len(catalog['clients']), n, p=catalog['client_weights'])
+    regions = catalog['client_regions'][clients]
+
+    # 85% of visits by a trainer from the client's region, if it has one
+    trainers = rng.integers(0, len(catalog['trainers']), n)
+    by_region = {}
+    for code, region in enumerate(catalog['trainer_regions']):
+        by_region.setdefault(region, []).append(code)
+    local = rng.random(n) < 0.85
+    for region, codes in by_region.items():
+        rows = local & (regions == region)
+        trainers[rows] = rng.choice(codes, rows.sum())
+
+    # Weekday visit dates
+    day_offsets = rng.integers(0, days, n)
+    dates = pd.Timestamp(start) + pd.to_timedelta(day_offsets, unit='D')
+    weekend = dates.dayofweek >= 5
+    dates = dates - pd.to_timedelta(np.where(weekend, dates.dayofweek - 4, 0), unit='D')
+
+    costs = np.round(rng.lognormal(mean=8.9, sigma=0.5, size=n) / 50) * 50
+
+    df = pd.DataFrame({
+        'Sr. No.': np.arange(first_sr_no, first_sr_no + n),
+        'Date ': dates.strftime('%d/%m/%Y'),
+        'Region': catalog['regions'][regions],
+        'Client Name': catalog['clients'][clients],
+        'Cost ': costs.astype(np.int64).astype(str),
+        'Name of Trainer': catalog['trainers'][trainers],
+        'Payment Type': rng.choice(PAYMENT_TYPES, n, p=PAYMENT_WEIGHTS),
+        'Remarks': rng.choice(REMARKS, n),
+    }, columns=COLUMNS)
+
+    # Dirty rows like the ones found in real exports
+    if invalid_rate > 0:
+        for column, value in (('Cost ', 'n/a'), ('Date ', 'TBD'), ('Client Name', None)):
+            rows = rng.random(n) < invalid_rate / 3
+            df.loc[rows, column] = value
+    return df
+
+
+def write_sample_csv(path, rows, regions=5, clients=200, trainers=25, start='2025-01-01', days=365,
+                     invalid_rate=0.001, seed=42, chunk_rows=CHUNK_ROWS):
+    """Writes a synthetic visit-plan CSV of `rows` rows to `path`, chunk by chunk."""
+    catalog = make_catalog(regions, clients, trainers, seed)
+    rng = np.random.default_rng(seed + 1)
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        # Leading metadata row of the export: one empty cell per column
+        f.write(',' * (len(COLUMNS) - 1) + '\n')
+        written = 0
+        while written < rows:
+            n = min(chunk_rows, rows - written)
+            chunk = generate_rows(n, catalog, rng, start, days, invalid_rate, first_sr_no=written + 1)
+            chunk.to_csv(f, index=False, header=written == 0)
+            written += n
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic L&D onsite visit-plan CSV.")
+    parser.add_argument('--rows', type=int, default=10_000, help="Number of data rows (default: 10000)")
+    parser.add_argument('--out', default='sample_visit_plan.csv', help="Output CSV path")
+    parser.add_argument('--regions', type=int, default=5, help="Number of regions (default: 5)")
+    parser.add_argument('--clients', type=int, default=200, help="Number of clients (default: 200)")
+    parser.add_argument('--trainers', type=int, default=25, help="Number of trainers (default: 25)")
+    parser.add_argument('--start', default='2025-01-01', help="First visit date, YYYY-MM-DD (default: 2025-01-01)")
+    parser.add_argument('--days', type=int, default=365, help="Days covered by the plan (default: 365)")
+    parser.add_argument('--invalid-rate', type=float, default=0.001, help="Share of invalid rows (default: 0.001)")
+    parser.add_argument('--seed', type=int, default=42, help="Random seed (default: 42)")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    write_sample_csv(args.out, args.rows, args.regions, args.clients, args.trainers,
+                     args.start, args.days, args.invalid_rate, args.seed)
+    print(f"Wrote {args.rows:,} rows to {args.out} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+"""
+Lightweight per-rerun instrumentation.
+
+Code marks its stages with named spans:
+
+    with span('filter', rows_in=len(df)) as s:
+        ...
+        s.rows_out = len(filtered_df)
+
+While a Trace is active on the current thread, each span records its wall
+time, rows in/out and, if the trace tracks memory, its peak traced memory
+(tracemalloc). With no active trace, span() costs next to nothing.
+
+tracemalloc is process-wide, so it runs while at least one trace (in any
+session or thread) tracks memory, and stops when the last of them ends.
+"""
+import json
+import os
+import threading
+import time
+import tracemalloc
+import weakref
+from contextlib import contextmanager
+from datetime import datetime
+
+# If set, every finished dashboard trace is appended to this file as one JSON line
+TRACE_LOG = os.environ.get('EXPENSE_TRACE_LOG')
+
+_local = threading.local()
+
+# Active traces tracking memory, across all threads
+_memory_traces = 0
+_memory_lock = threading.Lock()
+
+
+class Span:
+    """One timed stage of a trace."""
+
+    def __init__(self, name, depth, rows_in=None):
+        self.name = name
+        self.depth = depth
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.seconds = None
+        self.peak_bytes = None
+        self.error = None
+        self._start_bytes = None
+        self._peak_seen = 0
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'depth': self.depth,
+            'seconds': self.seconds,
+            'rows_in': self.rows_in,
+            'rows_out': self.rows_out,
+            'peak_bytes': self.peak_bytes,
+            'error': self.error,
+        }
+
+
+class _NullSpan:
+    """Stands in for a Span when no trace is active; ignores every update."""
+
+    def __setattr__(self, name, value):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Trace:
+    """
+    The spans recorded during one rerun (or one report), in start order.
+
+    Memory tracking uses tracemalloc, which slows allocation-heavy code
+    down, and its peaks are approximate while other threads allocate.
+    """
+
+    def __init__(self, name, track_memory=False):
+        self.name = name
+        self.track_memory = track_memory
+        self.started = datetime.now()
+        self.seconds = None
+        self._start = time.perf_counter()
+        self.spans = []
+        self._stack = []
+        self._lock = threading.Lock()
+        self._release_memory = None
+
+    def _enter(self, name, rows_in):
+        with self._lock:
+            s = Span(name, len(self._stack), rows_in)
+            self.spans.append(s)
+            if self.track_memory and tracemalloc.is_tracing():
+                current, peak = tracemalloc.get_traced_memory()
+                if self._stack:
+                    parent = self._stack[-1]
+                    parent._peak_seen = max(parent._peak_seen, peak)
+                tracemalloc.reset_peak()
+                s._start_bytes = current
+                s._peak_seen = current
+            self._stack.append(s)
+            return s
+
+    def _exit(self, s, seconds):
+        with self._lock:
+            s.seconds = seconds
+            if self._stack and self._stack[-1] is s:
+                self._stack.pop()
+            if self.track_memory and tracemalloc.is_tracing() and s._start_bytes is not None:
+                _, peak = tracemalloc.get_traced_memory()
+                s._peak_seen = max(s._peak_seen, peak)
+                s.peak_bytes = s._peak_seen - s._start_bytes
+                if self._stack:
+                    parent = self._stack[-1]
+                    parent._peak_seen = max(parent._peak_seen, s._peak_seen)
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'started': self.started.isoformat(timespec='seconds'),
+            'seconds': self.seconds,
+            'track_memory': self.track_memory,
+            'spans': [s.to_dict() for s in self.spans],
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2)
+
+    def rows(self):
+        """Spans as display rows, names indented by nesting depth."""
+        return [{
+            'Stage': '  ' * s.depth + s.name,
+            'Time (ms)': None if s.seconds is None else round(s.seconds * 1000, 1),
+            'Rows In': s.rows_in,
+            'Rows Out': s.rows_out,
+            'Peak Memory (MB)': None if s.peak_bytes is None else round(s.peak_bytes / 2**20, 2),
+            'Error': s.error,
+        } for s in self.spans]
+
+    def log(self, path=TRACE_LOG):
+        """Appends the trace as one JSON line to `path`, if set."""
+        if not path:
+            return
+        try:
+            with open(path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(self.to_dict()) + '\n')
+        except OSError as e:
+            print(f"Error writing trace log: {e}")
+
+
+def current_trace():
+    """The trace active on this thread, or None."""
+    return getattr(_local, 'trace', None)
+
+
+@contextmanager
+def use_trace(trace):
+    """Makes `trace` the active trace on this thread for the duration of the block."""
+    previous = current_trace()
+    _local.trace = trace
+    try:
+        yield trace
+    finally:
+        _local.trace = previous
+
+
+def _release_memory_tracking():
+    global _memory_traces
+    with _memory_lock:
+        _memory_traces -= 1
+        if _memory_traces == 0 and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+
+def start_trace(name, track_memory=False):
+    """Starts a new trace on this thread (and tracemalloc, if tracking memory)."""
+    global _memory_traces
+    stop_trace()
+    trace = Trace(name, track_memory)
+    if track_memory:
+        with _memory_lock:
+            _memory_traces += 1
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+        # Released once, when the trace is stopped or, if a rerun ended
+        # without stopping it, when it is garbage collected
+        trace._release_memory = weakref.finalize(trace, _release_memory_tracking)
+    _local.trace = trace
+    return trace
+
+
+def stop_trace():
+    """
+    Ends this thread's trace and returns it, or None if none was active.
+    tracemalloc is stopped, releasing its overhead, once no trace needs it.
+    """
+    trace = current_trace()
+    _local.trace = None
+    if trace is not None:
+        trace.seconds = time.perf_counter() - trace._start
+        if trace._release_memory is not None:
+            trace._release_memory()
+    return trace
+
+
+@contextmanager
+def span(name, rows_in=None):
+    """Records a named stage in the active trace, if any."""
+    trace = current_trace()
+    if trace is None:
+        yield _NULL_SPAN
+        return
+    s = trace._enter(name, rows_in)
+    start = time.perf_counter()
+    try:
+        yield s
+    except BaseException as e:
+        s.error = type(e).__name__
+        raise
+    finally:
+        trace._exit(s, time.perf_counter() - start)
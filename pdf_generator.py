@@ -8,17 +8,122 @@ from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from io import BytesIO
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import os
 import pandas as pd
+from caching import CACHE_DIR, LRUCache, DiskCache, content_hash
+from aggregation import as_cube, kpi_summary, dimension_stats, client_totals, cost_by
+from reportlab_charts import chart_drawing
+from chart_generator import DEFAULT_COLOR_SEQUENCE
+from instrumentation import span
 
+# Charts placed after each report section's table, in page order
+REPORT_CHARTS = {
+    'include_region': ['region_pie', 'region_trend', 'region_bar_group'],
+    'include_trainer': ['trainer_pie', 'trainer_efficiency', 'trainer_payment'],
+    'include_client': ['client_cost', 'client_scatter'],
+    'include_payment': ['payment_pie', 'payment_stack'],
+}
+
+# Chart renderers: 'plotly' exports the dashboard figures through Kaleido,
+# 'reportlab' draws them natively as vector graphics
+CHART_BACKENDS = ['plotly', 'reportlab']
+
+# Concurrent Kaleido exports while rasterizing a report's charts
+RASTER_WORKERS = 4
+
+# Final progress stage of a report some of whose charts could not be rendered
+CHARTS_MISSING_STAGE = "Done (some charts could not be rendered)"
+
+# Chart PNG export settings (independent of the report's page size)
+PNG_WIDTH, PNG_HEIGHT, PNG_SCALE = 800, 500, 2
+
+# Rasterized charts keyed by figure content, in memory and on local disk
+_png_memory_cache = LRUCache(max_entries=256, max_bytes=64 * 1024 * 1024)
+_png_disk_cache = DiskCache(os.path.join(CACHE_DIR, 'charts'), max_bytes=512 * 1024 * 1024, suffix='.png')
+
+# Unicode TrueType fonts tried in order: (name, regular file, bold file)
+FONT_CANDIDATES = [
+    ('Arial', 'C:\\Windows\\Fonts\\arial.ttf', 'C:\\Windows\\Fonts\\arialbd.ttf'),
+    ('Arial', '/usr/share/fonts/truetype/msttcorefonts/Arial.ttf', '/usr/share/fonts/truetype/msttcorefonts/Arial_Bold.ttf'),
+    ('Arial', '/Library/Fonts/Arial.ttf', '/Library/Fonts/Arial Bold.ttf'),
+    ('LiberationSans', '/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf', '/usr/share/fonts/truetype/liberation/LiberationSans-Bold.ttf'),
+    ('LiberationSans', '/usr/share/fonts/liberation-sans/LiberationSans-Regular.ttf', '/usr/share/fonts/liberation-sans/LiberationSans-Bold.ttf'),
+    ('DejaVuSans', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf', '/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf'),
+    ('DejaVuSans', '/usr/share/fonts/dejavu/DejaVuSans.ttf', '/usr/share/fonts/dejavu/DejaVuSans-Bold.ttf'),
+]
+
+@lru_cache(maxsize=None)
 def register_fonts():
-    """Registers Arial font for Unicode support."""
+    """
+    Registers the first available Unicode font (Arial, Liberation Sans or DejaVu Sans).
+    
+    Runs once per process; later calls return the registered font names.
+    """
+    for name, regular, bold in FONT_CANDIDATES:
+        if not (os.path.exists(regular) and os.path.exists(bold)):
+            continue
+        try:
+            pdfmetrics.registerFont(TTFont(name, regular))
+            pdfmetrics.registerFont(TTFont(f'{name}-Bold', bold))
+            return name, f'{name}-Bold'
+        except Exception as e:
+            print(f"Error registering font {regular}: {e}")
+    # Fallback to Helvetica if no TrueType font is found
+    return 'Helvetica', 'Helvetica-Bold'
+
+@lru_cache(maxsize=None)
+def report_styles(font_normal, font_bold):
+    """Paragraph styles for the report title, section headings and cover text, built once per font."""
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontName=font_bold,
+        fontSize=24,
+        textColor=colors.HexColor('#667eea'),
+        alignment=TA_CENTER,
+        spaceAfter=30
+    )
+    heading_style = ParagraphStyle(
+        'CustomHeading',
+        parent=styles['Heading2'],
+        fontName=font_bold,
+        fontSize=16,
+        textColor=colors.HexColor('#667eea'),
+        spaceAfter=12,
+        spaceBefore=12
+    )
+    cover_info_style = ParagraphStyle(
+        'CoverInfo',
+        parent=styles['Normal'],
+        fontName=font_normal,
+        fontSize=12,
+        alignment=TA_CENTER,
+        spaceAfter=10
+    )
+    return title_style, heading_style, cover_info_style
+
+def warm_up(start_kaleido=True):
+    """
+    Does the one-off setup of report generation ahead of the first report:
+    fonts, paragraph styles and, if `start_kaleido` and this Kaleido supports
+    it, a persistent browser for chart exports.
+    """
+    font_normal, font_bold = register_fonts()
+    report_styles(font_normal, font_bold)
+    if not start_kaleido:
+        return
     try:
-        pdfmetrics.registerFont(TTFont('Arial', 'C:\\Windows\\Fonts\\arial.ttf'))
-        pdfmetrics.registerFont(TTFont('Arial-Bold', 'C:\\Windows\\Fonts\\arialbd.ttf'))
-        return 'Arial', 'Arial-Bold'
+        import kaleido
+        if hasattr(kaleido, 'start_sync_server'):
+            # Kaleido() only locates Chrome; without it a started server would
+            # die in the background and leave every export waiting on it
+            kaleido.Kaleido()
+            kaleido.start_sync_server(silence_warnings=True)
     except Exception as e:
-        # Fallback to Helvetica if Arial is not found
-        return 'Helvetica', 'Helvetica-Bold'
+        print(f"Error starting Kaleido: {e}")
 
 def create_styled_table(data, col_widths, font_normal, font_bold, header_bg='#667eea', row_bg=colors.beige):
     """Creates a ReportLab Table with standard styling."""
@@ -37,33 +142,92 @@ def create_styled_table(data, col_widths, font_normal, font_bold, header_bg='#66
     ]))
     return t
 
-def fig_to_image(fig, width=6*inch, height=4*inch):
-    """Converts a Plotly figure to a ReportLab Image."""
+def fig_to_png(fig):
+    """
+    Rasterizes a Plotly figure to PNG bytes, or None if the export fails.
+    
+    Results are cached by a hash of the figure JSON and export size, so an
+    unchanged chart is never sent through Kaleido twice.
+    """
     if fig is None:
         return None
+    key = content_hash(f"{fig.to_json()}|{PNG_WIDTH}x{PNG_HEIGHT}@{PNG_SCALE}".encode('utf-8'))
+    
+    img_bytes = _png_memory_cache.get(key)
+    if img_bytes is None:
+        img_bytes = _png_disk_cache.get(key)
+        if img_bytes is not None:
+            _png_memory_cache.put(key, img_bytes)
+    if img_bytes is not None:
+        return img_bytes
+    
     try:
-        # Convert to PNG bytes
-        img_bytes = fig.to_image(format="png", width=800, height=500, scale=2)
-        return Image(BytesIO(img_bytes), width=width, height=height)
+        img_bytes = fig.to_image(format="png", width=PNG_WIDTH, height=PNG_HEIGHT, scale=PNG_SCALE)
     except Exception as e:
         print(f"Error converting figure to image: {e}")
         return None
+    _png_memory_cache.put(key, img_bytes)
+    _png_disk_cache.put(key, img_bytes)
+    return img_bytes
+
+def png_to_image(img_bytes, width=6*inch, height=4*inch):
+    """Wraps PNG bytes in a ReportLab Image."""
+    if img_bytes is None:
+        return None
+    return Image(BytesIO(img_bytes), width=width, height=height)
+
+def fig_to_image(fig, width=6*inch, height=4*inch):
+    """Converts a Plotly figure to a ReportLab Image."""
+    return png_to_image(fig_to_png(fig), width=width, height=height)
+
+def rasterize_figures(figures, max_workers=RASTER_WORKERS, on_done=None):
+    """
+    Rasterizes a dict of Plotly figures concurrently.
+    
+    Returns a dict with the same keys and PNG bytes (or None on failure).
+    `on_done(count)` is called with the number of figures done so far.
+    """
+    if not figures:
+        return {}
+    images = {}
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(figures))) as pool:
+        for key, img in zip(figures, pool.map(fig_to_png, figures.values())):
+            images[key] = img
+            if on_done is not None:
+                on_done(len(images))
+    return images
 
-def generate_expense_report(df, options, charts=None):
+def generate_expense_report(df, options, charts=None, progress=None, color_sequence=DEFAULT_COLOR_SEQUENCE):
     """
     Generates the PDF report and returns the bytes.
     
     Args:
-        df (pd.DataFrame): The filtered dataframe containing expense data.
+        df (pd.DataFrame): The filtered expense data, either raw rows or an
+            aggregation cube from `aggregation.build_cube`.
         options (dict): Configuration options for the report.
-        charts (dict): Dictionary of Plotly figures to include.
+        charts (dict): Dictionary of Plotly figures to include. Not needed
+            when options['chart_backend'] is 'reportlab'.
+        progress (callable): Called as progress(stage, fraction) while the
+            report is built: charts rasterized, tables built, doc.build.
+            The last stage is "Done", or CHARTS_MISSING_STAGE if a chart
+            failed to render. An exception it raises aborts the report.
+        color_sequence (list): Chart colors for the 'reportlab' backend (the
+            Plotly figures in `charts` carry their own).
     
     Returns:
         bytes: The generated PDF data.
     """
     buffer = BytesIO()
+    cube = as_cube(df)
     if charts is None:
         charts = {}
+    if progress is None:
+        progress = lambda stage, fraction: None
+    sections = [flag for flag in ['include_cover', 'include_kpi', *REPORT_CHARTS] if options.get(flag, True)]
+    
+    def section_done(flag):
+        """Reports the sections built so far (40-60% of the report)."""
+        progress("Building tables", 0.4 + 0.2 * (sections.index(flag) + 1) / len(sections))
     
     # Configure Page Size and Orientation
     page_size_map = {
@@ -87,40 +251,56 @@ def generate_expense_report(df, options, charts=None):
     
     elements = []
     font_normal, font_bold = register_fonts()
-    styles = getSampleStyleSheet()
-    
-    # Custom Styles
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontName=font_bold,
-        fontSize=24,
-        textColor=colors.HexColor('#667eea'),
-        alignment=TA_CENTER,
-        spaceAfter=30
-    )
-    heading_style = ParagraphStyle(
-        'CustomHeading',
-        parent=styles['Heading2'],
-        fontName=font_bold,
-        fontSize=16,
-        textColor=colors.HexColor('#667eea'),
-        spaceAfter=12,
-        spaceBefore=12
-    )
-    cover_info_style = ParagraphStyle(
-        'CoverInfo',
-        parent=styles['Normal'],
-        fontName=font_normal,
-        fontSize=12,
-        alignment=TA_CENTER,
-        spaceAfter=10
-    )
+    title_style, heading_style, cover_info_style = report_styles(font_normal, font_bold)
     
     # Calculate Metrics
-    total_cost = df['Cost'].sum()
-    total_sessions = df['Session_ID'].nunique() if 'Session_ID' in df.columns else 0
-    avg_cost = total_cost / total_sessions if total_sessions > 0 else 0
+    kpis = kpi_summary(cube)
+    total_cost = kpis['total_cost']
+    total_sessions = kpis['total_sessions']
+    avg_cost = kpis['avg_cost']
+    
+    chart_backend = options.get('chart_backend', 'plotly')
+    charts_missing = False
+    if chart_backend == 'reportlab':
+        chart_images = {}
+    else:
+        # Rasterize every chart the selected sections need up front, in parallel
+        report_figures = {
+            key: charts[key]
+            for flag, keys in REPORT_CHARTS.items() if options.get(flag, True)
+            for key in keys if key in charts
+        }
+        progress("Rasterizing charts", 0.0)
+        with span('pdf:rasterize', rows_in=len(report_figures)) as s:
+            chart_images = rasterize_figures(
+                report_figures,
+                on_done=lambda count: progress("Rasterizing charts", 0.4 * count / len(report_figures))
+            )
+            s.rows_out = sum(1 for img in chart_images.values() if img is not None)
+    
+    def add_chart(key, width, height, space_after):
+        """
+        Appends chart `key` and a spacer, if the chart could be rendered. A
+        chart that failed to render (not one with nothing to show) marks the
+        report as missing charts.
+        """
+        nonlocal charts_missing
+        if chart_backend == 'reportlab':
+            with span(f'pdf:draw:{key}', rows_in=len(cube)):
+                try:
+                    chart = chart_drawing(key, cube, width, height, color_sequence, font=font_normal,
+                                          raise_errors=True)
+                except Exception as e:
+                    print(f"Error drawing chart {key}: {e}")
+                    chart = None
+                    charts_missing = True
+        else:
+            chart = png_to_image(chart_images.get(key), width=width, height=height)
+            if chart is None and key in chart_images:
+                charts_missing = True
+        if chart is not None:
+            elements.append(chart)
+            elements.append(Spacer(1, space_after))
     
     # --- Content Generation ---
     
@@ -130,7 +310,7 @@ def generate_expense_report(df, options, charts=None):
         elements.append(Spacer(1, 50))
         
         elements.append(Paragraph(f"<b>Generated on:</b> {datetime.now().strftime('%B %d, %Y at %I:%M %p')}", cover_info_style))
-        elements.append(Paragraph(f"<b>Total Records:</b> {len(df)}", cover_info_style))
+        elements.append(Paragraph(f"<b>Total Records:</b> {kpis['total_records']}", cover_info_style))
         elements.append(Spacer(1, 50))
         
         # Summary Box
@@ -156,6 +336,7 @@ def generate_expense_report(df, options, charts=None):
         ]))
         elements.append(summary_table)
         elements.append(PageBreak())
+        section_done('include_cover')
     else:
         elements.append(Paragraph("Expense Analysis Report", title_style))
         elements.append(Paragraph(f"Generated on {datetime.now().strftime('%B %d, %Y')}", cover_info_style))
@@ -172,103 +353,79 @@ def generate_expense_report(df, options, charts=None):
         ]
         elements.append(create_styled_table(kpi_data, [3*inch, 3*inch], font_normal, font_bold))
         elements.append(Spacer(1, 20))
+        section_done('include_kpi')
 
     # Region Summary
     if options.get('include_region', True):
         elements.append(Paragraph("Regional Summary", heading_style))
-        region_stats = df.groupby('Region').agg({
-            'Cost': 'sum',
-            'Session_ID': 'nunique',
-            'Client Name': 'nunique'
-        }).reset_index()
-        region_stats = region_stats.sort_values('Cost', ascending=False)
+        region_stats = dimension_stats(cube, 'Region').reset_index()
+        region_stats = region_stats.sort_values('Total Cost', ascending=False)
         
         region_data = [['Region', 'Total Cost', 'Sessions', 'Clients']]
         for _, row in region_stats.iterrows():
             region_data.append([
                 str(row['Region']),
-                f"Rs. {row['Cost']:,.2f}",
-                str(row['Session_ID']),
-                str(row['Client Name'])
+                f"Rs. {row['Total Cost']:,.2f}",
+                str(row['Session Count']),
+                str(row['Number of Clients'])
             ])
         elements.append(create_styled_table(region_data, [1.5*inch]*4, font_normal, font_bold))
         elements.append(Spacer(1, 20))
         
         # Region Charts
-        if 'region_pie' in charts:
-            elements.append(fig_to_image(charts['region_pie'], width=6*inch, height=4*inch))
-            elements.append(Spacer(1, 10))
-        if 'region_trend' in charts:
-            elements.append(fig_to_image(charts['region_trend'], width=7*inch, height=4*inch))
-            elements.append(Spacer(1, 10))
-        if 'region_bar_group' in charts:
-            elements.append(fig_to_image(charts['region_bar_group'], width=7*inch, height=4*inch))
-            elements.append(Spacer(1, 20))
+        add_chart('region_pie', 6*inch, 4*inch, 10)
+        add_chart('region_trend', 7*inch, 4*inch, 10)
+        add_chart('region_bar_group', 7*inch, 4*inch, 20)
+        section_done('include_region')
 
     # Trainer Summary
     if options.get('include_trainer', True):
         elements.append(Paragraph("Trainer Summary", heading_style))
-        trainer_stats = df.groupby('Name of Trainer').agg({
-            'Cost': 'sum',
-            'Session_ID': 'nunique'
-        }).reset_index()
-        trainer_stats['Avg Cost'] = trainer_stats['Cost'] / trainer_stats['Session_ID']
-        trainer_stats = trainer_stats.sort_values('Cost', ascending=False).head(10)
+        trainer_stats = dimension_stats(cube, 'Name of Trainer').reset_index()
+        trainer_stats = trainer_stats.sort_values('Total Cost', ascending=False).head(10)
         
         trainer_data = [['Trainer', 'Total Cost', 'Sessions', 'Avg Cost']]
         for _, row in trainer_stats.iterrows():
             trainer_data.append([
                 str(row['Name of Trainer']),
-                f"Rs. {row['Cost']:,.2f}",
-                str(row['Session_ID']),
-                f"Rs. {row['Avg Cost']:,.2f}"
+                f"Rs. {row['Total Cost']:,.2f}",
+                str(row['Session Count']),
+                f"Rs. {row['Average Cost']:,.2f}"
             ])
         elements.append(create_styled_table(trainer_data, [1.5*inch]*4, font_normal, font_bold))
         elements.append(Spacer(1, 20))
         
         # Trainer Charts
-        if 'trainer_pie' in charts:
-            elements.append(fig_to_image(charts['trainer_pie'], width=6*inch, height=4*inch))
-            elements.append(Spacer(1, 10))
-        if 'trainer_efficiency' in charts:
-            elements.append(fig_to_image(charts['trainer_efficiency'], width=7*inch, height=4*inch))
-            elements.append(Spacer(1, 10))
-        if 'trainer_payment' in charts:
-            elements.append(fig_to_image(charts['trainer_payment'], width=7*inch, height=4*inch))
-            elements.append(Spacer(1, 20))
+        add_chart('trainer_pie', 6*inch, 4*inch, 10)
+        add_chart('trainer_efficiency', 7*inch, 4*inch, 10)
+        add_chart('trainer_payment', 7*inch, 4*inch, 20)
+        section_done('include_trainer')
 
     # Client Summary
     if options.get('include_client', True):
         elements.append(Paragraph("Client Summary (Top 15)", heading_style))
-        client_summary = df.groupby(['Region', 'Client Name']).agg({
-            'Cost': 'sum',
-            'Session_ID': 'nunique'
-        }).reset_index()
-        client_summary = client_summary.sort_values('Cost', ascending=False).head(15)
+        client_summary = client_totals(cube).head(15)
         
         client_data = [['Region', 'Client', 'Total Cost', 'Sessions']]
         for _, row in client_summary.iterrows():
             client_data.append([
                 str(row['Region']),
                 str(row['Client Name'])[:20],
-                f"Rs. {row['Cost']:,.2f}",
-                str(row['Session_ID'])
+                f"Rs. {row['Total Cost']:,.2f}",
+                str(row['Session Count'])
             ])
         elements.append(create_styled_table(client_data, [1.2*inch, 2*inch, 1.5*inch, 1.3*inch], font_normal, font_bold))
         elements.append(Spacer(1, 20))
         
         # Client Charts
-        if 'client_cost' in charts:
-            elements.append(fig_to_image(charts['client_cost'], width=7*inch, height=4*inch))
-            elements.append(Spacer(1, 10))
-        if 'client_scatter' in charts:
-            elements.append(fig_to_image(charts['client_scatter'], width=7*inch, height=4*inch))
-            elements.append(Spacer(1, 20))
+        add_chart('client_cost', 7*inch, 4*inch, 10)
+        add_chart('client_scatter', 7*inch, 4*inch, 20)
+        section_done('include_client')
 
     # Payment Analysis
     if options.get('include_payment', True):
         elements.append(Paragraph("Payment Method Distribution", heading_style))
-        payment_dist = df.groupby('Payment Type')['Cost'].sum().reset_index()
+        payment_dist = cost_by(cube, 'Payment Type')
         payment_dist = payment_dist.sort_values('Cost', ascending=False)
         
         payment_data = [['Payment Type', 'Total Cost', 'Percentage']]
@@ -283,13 +440,21 @@ def generate_expense_report(df, options, charts=None):
         elements.append(Spacer(1, 20))
         
         # Payment Charts
-        if 'payment_pie' in charts:
-            elements.append(fig_to_image(charts['payment_pie'], width=6*inch, height=4*inch))
-            elements.append(Spacer(1, 10))
-        if 'payment_stack' in charts:
-            elements.append(fig_to_image(charts['payment_stack'], width=7*inch, height=4*inch))
+        add_chart('payment_pie', 6*inch, 4*inch, 10)
+        add_chart('payment_stack', 7*inch, 4*inch, 0)
+        section_done('include_payment')
 
-    # Build PDF
-    doc.build(elements)
+    # Build PDF, reporting the share of flowables laid out so far
+    def on_build(kind, value):
+        if kind == 'SIZE_EST':
+            on_build.total = max(value, 1)
+        elif kind == 'PROGRESS':
+            progress("Laying out pages", 0.6 + 0.4 * min(value / on_build.total, 1))
+    on_build.total = max(len(elements), 1)
+    doc.setProgressCallBack(on_build)
+    progress("Laying out pages", 0.6)
+    with span('pdf:build', rows_in=len(elements)):
+        doc.build(elements)
+    progress(CHARTS_MISSING_STAGE if charts_missing else "Done", 1.0)
     buffer.seek(0)
     return buffer.getvalue()
@@ -0,0 +1,211 @@
+"""
+Long-lived PDF report workers.
+
+A small pool of background threads builds reports from a local job queue.
+The one-off report setup (fonts, paragraph styles, Kaleido's browser) is
+done as soon as the pool starts, and every Streamlit session shares the same
+warm pool, so the first report after a deploy is as fast as the rest.
+
+Jobs run without blocking the script run that submitted them: a ReportJob
+reports the current stage and progress, can be cancelled, and identical
+requests (same report_key) in flight at the same time share one job.
+Finished reports are kept on local disk under their report_key, so a
+repeated request, from any session, is answered from the cache.
+"""
+import os
+import queue
+import threading
+from concurrent.futures import Future
+import pandas as pd
+from pdf_generator import CHARTS_MISSING_STAGE, generate_expense_report, warm_up
+from chart_generator import DEFAULT_COLOR_SEQUENCE
+from caching import CACHE_DIR, DiskCache, content_hash
+from instrumentation import current_trace, span, start_trace, stop_trace
+
+# Reports built at the same time; more jobs wait in the queue
+REPORT_WORKERS = 2
+
+# Finished PDFs keyed by report_key, least recently used evicted past the budget
+PDF_CACHE_BYTES = 256 * 1024 * 1024
+_pdf_cache = DiskCache(os.path.join(CACHE_DIR, 'reports'), max_bytes=PDF_CACHE_BYTES, suffix='.pdf')
+
+# Stage of a job answered from the PDF cache
+CACHED_STAGE = "Done (cached)"
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+class ReportCancelled(Exception):
+    """Raised by a report job's result() once the job has been cancelled."""
+
+
+def report_key(df, options, color_sequence=None, template=None):
+    """
+    Fingerprint of a report request: the report data, its options and the
+    chart colors. Requests with equal keys produce the same PDF.
+    """
+    data = pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes()
+    settings = repr((sorted(options.items()), list(color_sequence or []), template))
+    return content_hash(data + settings.encode('utf-8'))
+
+
+class ReportJob:
+    """
+    One queued or running report.
+
+    `stage` and `progress` (0 to 1) are updated by the worker as the report
+    is built; result() blocks until the PDF bytes are ready. If the request
+    was made while tracing, `trace` holds the report's own spans once done.
+    """
+
+    def __init__(self, worker, key):
+        self.key = key
+        self.stage = "Queued"
+        self.progress = 0.0
+        self.trace = None
+        self.future = Future()
+        self._worker = worker
+        self._cancelled = threading.Event()
+        self._waiters = 1
+
+    def done(self):
+        return self.future.done()
+
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def result(self, timeout=None):
+        """The PDF bytes; raises the report's error, or ReportCancelled."""
+        if self.future.cancelled():
+            raise ReportCancelled()
+        return self.future.result(timeout)
+
+    def cancel(self):
+        """
+        Withdraws this caller's request. The report itself is stopped (at its
+        next progress update) once no other caller is waiting for it.
+        """
+        self._worker._release(self)
+
+    def _update(self, stage, fraction):
+        if self._cancelled.is_set():
+            raise ReportCancelled()
+        self.stage = stage
+        self.progress = min(max(fraction, 0.0), 1.0)
+
+
+class ReportWorker:
+    """Builds PDF reports on a bounded pool of warm background threads."""
+
+    def __init__(self, workers=REPORT_WORKERS):
+        self._jobs = queue.Queue()
+        self._threads = [
+            threading.Thread(target=self._run, name=f'report-worker-{i + 1}', daemon=True)
+            for i in range(workers)
+        ]
+        self._warm_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self.ready = threading.Event()
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def submit(self, df, options, charts=None, key=None, color_sequence=DEFAULT_COLOR_SEQUENCE):
+        """
+        Queues a report and returns its ReportJob.
+
+        Arguments are those of `pdf_generator.generate_expense_report`. With a
+        `key` (see report_key), a report already in the PDF cache comes back
+        as a finished job, and a request matching a job still in flight joins
+        that job instead of queueing another. If the submitting thread has a
+        trace, the report is traced too, in the job's own trace (the rerun
+        that submitted it does not wait for it).
+        """
+        with self._lock:
+            job = self._in_flight.get(key) if key is not None else None
+            if job is not None:
+                job._waiters += 1
+                return job
+            job = ReportJob(self, key)
+            if key is not None:
+                with span('pdf:cache'):
+                    pdf_bytes = _pdf_cache.get(key)
+                if pdf_bytes is not None:
+                    job.stage, job.progress = CACHED_STAGE, 1.0
+                    job.future.set_result(pdf_bytes)
+                    return job
+                self._in_flight[key] = job
+        # Whether to trace the report, and its memory (None: no trace)
+        trace = current_trace()
+        track_memory = None if trace is None else trace.track_memory
+        self._jobs.put((job, df, options, charts, color_sequence, track_memory))
+        return job
+
+    def stop(self):
+        """Finishes the queued jobs, then ends the worker threads."""
+        for _ in self._threads:
+            self._jobs.put(None)
+        for thread in self._threads:
+            thread.join()
+
+    def _release(self, job):
+        with self._lock:
+            if job._waiters > 0:
+                job._waiters -= 1
+            if job._waiters > 0 or job.done():
+                return
+            job._cancelled.set()
+            if self._in_flight.get(job.key) is job:
+                del self._in_flight[job.key]
+        # Only a job still in the queue can be cancelled here; a running one
+        # stops at its next progress update
+        job.future.cancel()
+
+    def _run(self):
+        with self._warm_lock:
+            if not self.ready.is_set():
+                try:
+                    warm_up()
+                finally:
+                    self.ready.set()
+
+        while True:
+            item = self._jobs.get()
+            if item is None:
+                break
+            job, df, options, charts, color_sequence, track_memory = item
+            if not job.future.set_running_or_notify_cancel():
+                continue
+            if track_memory is not None:
+                start_trace('pdf', track_memory=track_memory)
+            try:
+                try:
+                    pdf_bytes = generate_expense_report(df, options, charts, progress=job._update,
+                                                        color_sequence=color_sequence)
+                finally:
+                    # Set before the result, so it is there once the job is done
+                    job.trace = stop_trace()
+                # Reports missing a chart (e.g. Kaleido or a drawing failed) are
+                # built again next time
+                if job.key is not None and job.stage != CHARTS_MISSING_STAGE:
+                    _pdf_cache.put(job.key, pdf_bytes)
+                job.future.set_result(pdf_bytes)
+            except Exception as e:
+                job.future.set_exception(e)
+            finally:
+                with self._lock:
+                    if self._in_flight.get(job.key) is job:
+                        del self._in_flight[job.key]
+
+
+def get_report_worker():
+    """Returns the process-wide report worker pool, starting it on first use."""
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = ReportWorker().start()
+        return _worker
@@ -0,0 +1,417 @@
+"""
+Native ReportLab renderer for the PDF report's charts.
+
+Draws the report charts directly as ReportLab vector graphics from the same
+aggregation cube the Plotly charts use, so the PDF needs no Kaleido or
+headless browser. Selected with `options['chart_backend'] = 'reportlab'`.
+"""
+from datetime import date
+from reportlab.graphics.shapes import Drawing, Group, String, Rect
+from reportlab.graphics.charts.barcharts import VerticalBarChart
+from reportlab.graphics.charts.doughnut import Doughnut
+from reportlab.graphics.charts.legends import Legend
+from reportlab.graphics.charts.linecharts import HorizontalLineChart
+from reportlab.graphics.charts.lineplots import LinePlot
+from reportlab.graphics.widgets.markers import makeMarker
+from reportlab.lib import colors
+from chart_generator import DEFAULT_COLOR_SEQUENCE, OTHER_LABEL, cap_categories, top_rows
+from aggregation import cost_by, cost_pivot, dimension_stats, client_totals, weekly_matrix
+
+TITLE_SIZE = 12
+LABEL_SIZE = 7
+
+# Above this many categories the axis labels would overlap and are left out
+MAX_CATEGORY_LABELS = 60
+
+# Plotly's Viridis colorscale stops, used for the heatmap
+VIRIDIS = ['#440154', '#482878', '#3e4989', '#31688e', '#26828e', '#1f9e89', '#35b779', '#6ece58', '#b5de2b', '#fde725']
+
+
+def si_format(value):
+    """Formats a number with two significant digits and an SI suffix, like Plotly's '.2s'."""
+    value = float(f"{value:.2g}")
+    for threshold, suffix in ((1e9, 'G'), (1e6, 'M'), (1e3, 'k')):
+        if abs(value) >= threshold:
+            return f"{value / threshold:g}{suffix}"
+    return f"{value:g}"
+
+
+def _palette(color_sequence, n):
+    return [colors.HexColor(color_sequence[i % len(color_sequence)]) for i in range(n)]
+
+
+def _canvas(width, height, title, font):
+    """Empty drawing with the chart title along the top edge."""
+    drawing = Drawing(width, height)
+    drawing.add(String(width / 2, height - TITLE_SIZE - 4, title,
+                       fontName=font, fontSize=TITLE_SIZE, textAnchor='middle'))
+    return drawing
+
+
+def _legend(drawing, names, palette, x, y, font):
+    legend = Legend()
+    legend.x, legend.y = x, y
+    legend.fontName = font
+    legend.fontSize = LABEL_SIZE
+    legend.alignment = 'right'
+    legend.boxAnchor = 'nw'
+    legend.dx = legend.dy = 6
+    legend.deltay = LABEL_SIZE + 3
+    legend.columnMaximum = max(1, int((y - 10) // legend.deltay))
+    legend.colorNamePairs = [(palette[i], str(name)) for i, name in enumerate(names)]
+    drawing.add(legend)
+
+
+def _style_category_axis(axis, names, font):
+    axis.categoryNames = [str(name) for name in names]
+    axis.labels.fontName = font
+    axis.labels.fontSize = LABEL_SIZE
+    if len(names) > MAX_CATEGORY_LABELS:
+        axis.visibleLabels = False
+    elif len(names) > 6:
+        axis.labels.angle = 45 if len(names) <= 20 else 90
+        axis.labels.boxAnchor = 'ne' if len(names) <= 20 else 'e'
+        axis.labels.dx, axis.labels.dy = 0, -4
+
+
+def _style_value_axis(axis, font):
+    axis.valueMin = 0
+    axis.labels.fontName = font
+    axis.labels.fontSize = LABEL_SIZE
+    axis.labelTextFormat = si_format
+    axis.visibleGrid = True
+    axis.gridStrokeColor = colors.lightgrey
+
+
+def _plot_area(width, height, names=()):
+    """x, y, width, height of the plot area, leaving room for rotated category labels."""
+    longest = max((len(str(name)) for name in names), default=0)
+    if len(names) <= 6 or len(names) > MAX_CATEGORY_LABELS:
+        bottom = 30
+    else:
+        bottom = min(30 + longest * 3.5, height * 0.4)
+    return 45, bottom, width - 45 - 120, height - bottom - TITLE_SIZE - 20
+
+
+def donut(title, names, values, color_sequence, width, height, font='Helvetica'):
+    """Donut chart with percentage labels and a legend."""
+    if len(values) == 0 or sum(values) <= 0:
+        return None
+    drawing = _canvas(width, height, title, font)
+    palette = _palette(color_sequence, len(names))
+    total = float(sum(values))
+
+    size = min(width - 160, height - TITLE_SIZE - 30)
+    chart = Doughnut()
+    chart.x, chart.y = (width - 160 - size) / 2, (height - TITLE_SIZE - 10 - size) / 2
+    chart.width = chart.height = size
+    chart.data = [float(v) for v in values]
+    chart.innerRadiusFraction = 0.5
+    chart.labels = [f"{v / total:.1%}" if v / total >= 0.04 else '' for v in values]
+    chart.slices.fontName = font
+    chart.slices.fontSize = LABEL_SIZE
+    chart.slices.fontColor = colors.white
+    chart.slices.strokeColor = colors.white
+    chart.slices.strokeWidth = 0.5
+    chart.slices.labelRadius = 0.75
+    for i, color in enumerate(palette):
+        chart.slices[i].fillColor = color
+    drawing.add(chart)
+
+    _legend(drawing, [f"{name} (Rs. {si_format(v)})" for name, v in zip(names, values)],
+            palette, width - 150, height - TITLE_SIZE - 20, font)
+    return drawing
+
+
+def bars(title, names, series, color_sequence, width, height, stacked=False, font='Helvetica'):
+    """Grouped (or stacked) vertical bars; `series` is a list of (name, values) pairs."""
+    if len(names) == 0 or not series:
+        return None
+    drawing = _canvas(width, height, title, font)
+    palette = _palette(color_sequence, len(series))
+
+    chart = VerticalBarChart()
+    chart.x, chart.y, chart.width, chart.height = _plot_area(width, height, names)
+    chart.data = [[float(v) for v in values] for _, values in series]
+    chart.groupSpacing = 6
+    chart.barSpacing = 1
+    chart.bars.strokeColor = None
+    for i, color in enumerate(palette):
+        chart.bars[i].fillColor = color
+    if stacked:
+        chart.categoryAxis.style = 'stacked'
+    elif len(names) * len(series) <= 40:
+        chart.barLabelFormat = lambda v: si_format(v) if v else ''
+        chart.barLabels.fontName = font
+        chart.barLabels.fontSize = LABEL_SIZE - 1
+        chart.barLabels.nudge = 5
+    _style_category_axis(chart.categoryAxis, names, font)
+    _style_value_axis(chart.valueAxis, font)
+    drawing.add(chart)
+
+    _legend(drawing, [name for name, _ in series], palette, width - 110, height - TITLE_SIZE - 20, font)
+    return drawing
+
+
+def category_lines(title, names, series, color_sequence, width, height, font='Helvetica'):
+    """Lines with markers over categorical x values; `series` is a list of (name, values) pairs."""
+    if len(names) == 0 or not series:
+        return None
+    drawing = _canvas(width, height, title, font)
+    palette = _palette(color_sequence, len(series))
+
+    chart = HorizontalLineChart()
+    chart.x, chart.y, chart.width, chart.height = _plot_area(width, height, names)
+    chart.data = [[float(v) for v in values] for _, values in series]
+    chart.joinedLines = 1
+    for i, color in enumerate(palette):
+        chart.lines[i].strokeColor = color
+        chart.lines[i].strokeWidth = 1.5
+        chart.lines[i].symbol = makeMarker('FilledCircle', size=3, fillColor=color, strokeColor=color)
+    if len(names) <= 30:
+        chart.lineLabelFormat = si_format
+        chart.lineLabels.fontName = font
+        chart.lineLabels.fontSize = LABEL_SIZE - 1
+        chart.lineLabels.dy = 6
+    _style_category_axis(chart.categoryAxis, names, font)
+    _style_value_axis(chart.valueAxis, font)
+    drawing.add(chart)
+
+    _legend(drawing, [name for name, _ in series], palette, width - 110, height - TITLE_SIZE - 20, font)
+    return drawing
+
+
+def time_lines(title, series, color_sequence, width, height, font='Helvetica'):
+    """Lines with markers over dates; `series` is a list of (name, dates, values) triples."""
+    series = [s for s in series if len(s[1])]
+    if not series:
+        return None
+    drawing = _canvas(width, height, title, font)
+    palette = _palette(color_sequence, len(series))
+
+    chart = LinePlot()
+    chart.x, chart.y, chart.width, chart.height = _plot_area(width, height)
+    chart.data = [
+        [(d.toordinal(), float(v)) for d, v in zip(dates, values)]
+        for _, dates, values in series
+    ]
+    for i, color in enumerate(palette):
+        chart.lines[i].strokeColor = color
+        chart.lines[i].strokeWidth = 1.5
+        chart.lines[i].symbol = makeMarker('FilledCircle', size=3, fillColor=color, strokeColor=color)
+
+    points = [x for line in chart.data for x, _ in line]
+    if min(points) == max(points):
+        chart.xValueAxis.valueMin, chart.xValueAxis.valueMax = min(points) - 7, max(points) + 7
+    chart.xValueAxis.labels.fontName = font
+    chart.xValueAxis.labels.fontSize = LABEL_SIZE
+    chart.xValueAxis.labelTextFormat = lambda x: date.fromordinal(int(x)).strftime('%d %b %y')
+    _style_value_axis(chart.yValueAxis, font)
+    drawing.add(chart)
+
+    _legend(drawing, [name for name, _, _ in series], palette, width - 110, height - TITLE_SIZE - 20, font)
+    return drawing
+
+
+def heatmap(title, matrix, width, height, font='Helvetica'):
+    """Heatmap of a (rows x columns) DataFrame on the Viridis scale, with cell values."""
+    if matrix.empty:
+        return None
+    drawing = _canvas(width, height, title, font)
+    n_rows, n_cols = matrix.shape
+    left = 10 + min(max(len(str(r)) for r in matrix.index), 20) * 4
+    bottom = 10 + min(max(len(str(c)) for c in matrix.columns), 20) * 3.5
+    cell_w = (width - left - 10) / n_cols
+    cell_h = (height - bottom - TITLE_SIZE - 20) / n_rows
+
+    values = matrix.to_numpy(dtype=float)
+    low, high = values.min(), values.max()
+    span = high - low if high > low else 1
+    show_text = cell_w >= 22 and cell_h >= 10
+    for i, row in enumerate(matrix.index):
+        # First row at the top, like Plotly's default heatmap
+        y = bottom + (n_rows - 1 - i) * cell_h
+        for j in range(n_cols):
+            shade = (values[i, j] - low) / span
+            fill = colors.HexColor(VIRIDIS[min(int(shade * len(VIRIDIS)), len(VIRIDIS) - 1)])
+            drawing.add(Rect(left + j * cell_w, y, cell_w, cell_h, fillColor=fill, strokeColor=colors.white, strokeWidth=0.5))
+            if show_text:
+                drawing.add(String(left + (j + 0.5) * cell_w, y + cell_h / 2 - 2, f"{values[i, j]:.0f}",
+                                   fontName=font, fontSize=LABEL_SIZE - 1, textAnchor='middle',
+                                   fillColor=colors.white if shade < 0.6 else colors.black))
+        drawing.add(String(left - 4, y + cell_h / 2 - 2, str(row)[:20],
+                           fontName=font, fontSize=LABEL_SIZE, textAnchor='end'))
+    for j, col in enumerate(matrix.columns):
+        label = String(0, 0, str(col)[:20], fontName=font, fontSize=LABEL_SIZE, textAnchor='end')
+        x = left + (j + 0.5) * cell_w
+        drawing.add(_rotated(label, x, bottom - 4))
+    return drawing
+
+
+def _rotated(shape, x, y, angle=60):
+    group = Group(shape)
+    group.translate(x, y)
+    group.rotate(angle)
+    return group
+
+
+# --- Report charts, keyed like chart_generator.CHART_BUILDERS ---
+
+def _region_pie(cube, color_sequence, width, height, font):
+    region_summary = cost_by(cube, 'Region').sort_values('Cost', ascending=False)
+    return donut("Regional Cost Distribution", region_summary['Region'].tolist(), region_summary['Cost'].tolist(),
+                 color_sequence, width, height, font)
+
+
+def _weekly_series(cube, by):
+    matrix = weekly_matrix(cube, by)
+    series = []
+    for name, row in matrix.iterrows():
+        row = row.dropna()
+        series.append((name, row.index.date.tolist(), row.tolist()))
+    return series
+
+
+def _region_trend(cube, color_sequence, width, height, font):
+    if cube.empty:
+        return None
+    return time_lines("Weekly Cost Trends by Region", _weekly_series(cube, 'Region'),
+                      color_sequence, width, height, font)
+
+
+def _region_bar_group(cube, color_sequence, width, height, font):
+    stats = dimension_stats(cube, 'Region').sort_values('Total Cost', ascending=False)
+    return bars("Regional Cost Analysis: Total vs Average", stats.index.tolist(), [
+        ('Total Cost', stats['Total Cost'].tolist()),
+        ('Average Session Cost', (stats['Total Cost'] / stats['Session Count']).tolist()),
+    ], color_sequence, width, height, font=font)
+
+
+def _region_activity(cube, color_sequence, width, height, font):
+    stats = dimension_stats(cube, 'Region').sort_values('Session Count', ascending=False)
+    return bars("Regional Activity: Sessions & Clients", stats.index.tolist(), [
+        ('Session Count', stats['Session Count'].tolist()),
+        ('Client Count', stats['Number of Clients'].tolist()),
+    ], color_sequence, width, height, font=font)
+
+
+def _trainer_payment(cube, color_sequence, width, height, font):
+    matrix = cost_pivot(cap_categories(cube, 'Name of Trainer'), 'Name of Trainer', 'Payment Type')
+    order = matrix.sum(axis=1).sort_values(ascending=False).index
+    order = [t for t in order if t != OTHER_LABEL] + [t for t in order if t == OTHER_LABEL]
+    matrix = matrix.reindex(order, fill_value=0)
+    return bars("Trainer Expenses by Payment Method", matrix.index.tolist(),
+                [(col, matrix[col].tolist()) for col in matrix.columns],
+                color_sequence, width, height, font=font)
+
+
+def _trainer_heatmap(cube, color_sequence, width, height, font):
+    return heatmap("Regional-Trainer Cost Heatmap", cost_pivot(cube, 'Region', 'Name of Trainer'), width, height, font)
+
+
+def _trainer_efficiency(cube, color_sequence, width, height, font):
+    stats = dimension_stats(cap_categories(cube, 'Name of Trainer'), 'Name of Trainer')
+    return category_lines("Trainer Cost Efficiency: Avg Cost vs Weekly Cost", stats.index.tolist(), [
+        ('Average Cost', stats['Average Cost'].tolist()),
+        ('Average Weekly Cost', stats['Average Weekly Cost'].tolist()),
+    ], color_sequence, width, height, font)
+
+
+def _trainer_pie(cube, color_sequence, width, height, font):
+    stats = dimension_stats(cube, 'Name of Trainer').reset_index()
+    stats = top_rows(stats[['Name of Trainer', 'Total Cost']], 'Total Cost', ['Name of Trainer'])
+    return donut("Trainer Expense Distribution", stats['Name of Trainer'].tolist(), stats['Total Cost'].tolist(),
+                 color_sequence, width, height, font)
+
+
+def _trainer_trend(cube, color_sequence, width, height, font):
+    if cube.empty:
+        return None
+    cube = cap_categories(cube, 'Name of Trainer')
+    return time_lines("Weekly Cost Trends by Trainer", _weekly_series(cube, 'Name of Trainer'),
+                      color_sequence, width, height, font)
+
+
+def _client_cost(cube, color_sequence, width, height, font):
+    clients = top_rows(client_totals(cube), 'Total Cost', ['Region', 'Client Name'])
+    return category_lines("Client Cost Overview", clients['Client Name'].tolist(),
+                          [('Total Cost', clients['Total Cost'].tolist())],
+                          color_sequence, width, height, font)
+
+
+def _client_scatter(cube, color_sequence, width, height, font):
+    """Session count per client, one marker series per Region (marker size is fixed)."""
+    clients = top_rows(client_totals(cube), 'Total Cost', ['Region', 'Client Name'])
+    if clients.empty:
+        return None
+    drawing = _canvas(width, height, "Client Session Analysis", font)
+    names = clients['Client Name'].tolist()
+    regions = clients['Region'].unique().tolist()
+    palette = _palette(color_sequence, len(regions))
+
+    chart = HorizontalLineChart()
+    chart.x, chart.y, chart.width, chart.height = _plot_area(width, height, names)
+    # One series per region, with gaps (None) at other regions' clients
+    chart.data = [
+        [float(s) if r == region else None for r, s in zip(clients['Region'], clients['Session Count'])]
+        for region in regions
+    ]
+    for i, color in enumerate(palette):
+        chart.lines[i].strokeColor = None
+        chart.lines[i].symbol = makeMarker('FilledCircle', size=5, fillColor=color, strokeColor=color)
+    _style_category_axis(chart.categoryAxis, names, font)
+    _style_value_axis(chart.valueAxis, font)
+    chart.valueAxis.labelTextFormat = '%d'
+    drawing.add(chart)
+
+    _legend(drawing, regions, palette, width - 110, height - TITLE_SIZE - 20, font)
+    return drawing
+
+
+def _payment_pie(cube, color_sequence, width, height, font):
+    payment_dist = cost_by(cube, 'Payment Type').sort_values('Cost', ascending=False)
+    return donut("Payment Method Distribution", payment_dist['Payment Type'].tolist(), payment_dist['Cost'].tolist(),
+                 color_sequence, width, height, font)
+
+
+def _payment_stack(cube, color_sequence, width, height, font):
+    matrix = cost_pivot(cube, 'Region', 'Payment Type')
+    return bars("Payment Methods by Region", matrix.index.tolist(),
+                [(col, matrix[col].tolist()) for col in matrix.columns],
+                color_sequence, width, height, stacked=True, font=font)
+
+
+DRAWING_BUILDERS = {
+    'region_pie': _region_pie,
+    'region_trend': _region_trend,
+    'region_bar_group': _region_bar_group,
+    'region_activity': _region_activity,
+    'trainer_payment': _trainer_payment,
+    'trainer_heatmap': _trainer_heatmap,
+    'trainer_efficiency': _trainer_efficiency,
+    'trainer_pie': _trainer_pie,
+    'trainer_trend': _trainer_trend,
+    'client_cost': _client_cost,
+    'client_scatter': _client_scatter,
+    'payment_pie': _payment_pie,
+    'payment_stack': _payment_stack,
+}
+
+
+def chart_drawing(key, cube, width, height, color_sequence=DEFAULT_COLOR_SEQUENCE, font='Helvetica',
+                  raise_errors=False):
+    """
+    Draws the report chart `key` as a ReportLab Drawing of the given size.
+
+    Returns None if the chart has nothing to show, or if it fails to draw
+    (with `raise_errors`, the error is raised instead).
+    """
+    if cube.empty:
+        return None
+    try:
+        return DRAWING_BUILDERS[key](cube, color_sequence, width, height, font)
+    except Exception as e:
+        if raise_errors:
+            raise
+        print(f"Error drawing chart {key}: {e}")
+        return None
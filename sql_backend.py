@@ -0,0 +1,141 @@
+"""
+Optional embedded SQL backend for large datasets.
+
+A loaded dataset is copied once to a local Parquet file, and each rerun's
+filtered aggregation cube is computed by DuckDB, an in-process analytical
+engine, as one GROUP BY over that file. Filtering and grouping then run
+multi-threaded and column-at-a-time, and the filtered rows are never copied
+into pandas. The summary tables, payment pivot, chart inputs and PDF tables
+are all derived from the cube, so they come out exactly as with pandas.
+
+Everything runs inside the Streamlit process on local files; DuckDB is only
+needed when the backend is used (`pip install duckdb`).
+"""
+import importlib.util
+import os
+import threading
+import weakref
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from aggregation import CUBE_DIMENSIONS, ROW_COUNT, week_labels
+
+# Datasets with at least this many rows use the SQL backend by default
+SQL_BACKEND_MIN_ROWS = 1_000_000
+
+# The cube's categorical dimensions; they are stored as integer category codes
+CODED_DIMENSIONS = [col for col in CUBE_DIMENSIONS if col != 'Date']
+
+# Full-width type each compact Cost type is summed in (see build_cube)
+_SUM_DTYPES = {'float32': 'float64', 'int32': 'int64'}
+
+
+def duckdb_available():
+    """True if the optional duckdb package is installed."""
+    return importlib.util.find_spec('duckdb') is not None
+
+
+def _quote(column):
+    return '"' + column.replace('"', '""') + '"'
+
+
+def _release(con, path):
+    """Closes a backend's connection and removes its Parquet copy."""
+    con.close()
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class SQLBackend:
+    """
+    DuckDB queries over a Parquet copy of a dataset's rows (or streamed cube).
+
+    Dimensions are stored as their pandas category codes, so filters compare
+    integers and results map straight back onto the dataset's categoricals.
+    """
+
+    def __init__(self, path, dtypes, has_row_count=False):
+        import duckdb
+        self.path = path
+        self.dtypes = dtypes
+        self.has_row_count = has_row_count
+        self._con = duckdb.connect()
+        self._con.execute("CREATE VIEW expense_rows AS SELECT * FROM read_parquet('{}')".format(path.replace("'", "''")))
+        self._lock = threading.Lock()
+        # Also released once the backend is garbage collected, or at exit
+        self._finalizer = weakref.finalize(self, _release, self._con, path)
+
+    @classmethod
+    def from_frame(cls, df, path):
+        """Writes the cube columns of `df` to Parquet at `path` and opens a backend on it."""
+        columns = {
+            'Date': pa.array(df['Date']),
+            'Cost': pa.array(df['Cost']),
+            'Session_ID': pa.array(df['Session_ID']),
+        }
+        for col in CODED_DIMENSIONS:
+            codes = df[col].cat.codes
+            columns[col] = pa.array(codes, mask=(codes < 0).to_numpy())
+        if ROW_COUNT in df.columns:
+            columns[ROW_COUNT] = pa.array(df[ROW_COUNT])
+        pq.write_table(pa.table(columns), path)
+        dtypes = {col: df[col].dtype for col in ['Date', 'Cost', 'Session_ID'] + CODED_DIMENSIONS}
+        return cls(path, dtypes, has_row_count=ROW_COUNT in df.columns)
+
+    def _where(self, start_date, end_date, filters):
+        conditions, params = [], []
+        if start_date is not None:
+            conditions.append('"Date" >= ?')
+            params.append(pd.Timestamp(start_date).to_pydatetime())
+        if end_date is not None:
+            conditions.append('"Date" < ?')
+            params.append((pd.Timestamp(end_date) + pd.Timedelta(days=1)).to_pydatetime())
+        for column, values in filters:
+            codes = self.dtypes[column].categories.get_indexer(list(values))
+            conditions.append(f'list_contains(?, {_quote(column)})')
+            params.append([int(code) for code in codes if code >= 0])
+        return (' WHERE ' + ' AND '.join(conditions)) if conditions else '', params
+
+    def cube(self, start_date=None, end_date=None, filters=()):
+        """
+        The aggregation cube of the rows in start_date..end_date (inclusive)
+        matching every (column, values) pair in `filters`; the same frame as
+        build_cube() on those rows.
+        """
+        cost_sum = 'fsum("Cost")' if self.dtypes['Cost'].kind == 'f' else 'SUM("Cost")'
+        row_count = f'SUM({_quote(ROW_COUNT)})' if self.has_row_count else 'COUNT(*)'
+        dimensions = ', '.join(_quote(col) for col in CUBE_DIMENSIONS)
+        where, params = self._where(start_date, end_date, filters)
+        sql = (
+            f'SELECT {dimensions}, {cost_sum} AS "Cost", MIN("Session_ID") AS "Session_ID", '
+            f'{row_count} AS {_quote(ROW_COUNT)} '
+            f'FROM expense_rows{where} '
+            f'GROUP BY {dimensions} ORDER BY {dimensions} NULLS LAST'
+        )
+        with self._lock:
+            if self._con is None:
+                raise RuntimeError("The SQL backend has been closed.")
+            cursor = self._con.cursor()
+        try:
+            result = cursor.execute(sql, params).df()
+        finally:
+            cursor.close()
+
+        cube = pd.DataFrame({'Date': result['Date'].astype(self.dtypes['Date'])})
+        for col in CODED_DIMENSIONS:
+            codes = result[col].fillna(-1).astype('int64')
+            cube[col] = pd.Categorical.from_codes(codes, dtype=self.dtypes[col])
+        cost_dtype = _SUM_DTYPES.get(str(self.dtypes['Cost']), self.dtypes['Cost'])
+        cube['Cost'] = result['Cost'].astype(cost_dtype)
+        cube['Session_ID'] = result['Session_ID'].astype(self.dtypes['Session_ID'])
+        cube[ROW_COUNT] = result[ROW_COUNT].astype('int64')
+        cube['Week'] = week_labels(cube['Date'])
+        return cube
+
+    def close(self):
+        """Closes the connection and removes the Parquet copy."""
+        with self._lock:
+            self._con = None
+            self._finalizer()
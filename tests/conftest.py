@@ -0,0 +1,62 @@
+"""
+Shared test data: randomized expense rows loaded the way the app loads them
+(sorted by Date, dimensions as categoricals, compact Cost, Session_ID), with
+missing values in every dimension.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_loader import DIMENSION_COLUMNS, clean_expense_data
+
+# Distinct values per dimension, and the share of rows left blank
+DIMENSION_SIZES = {'Region': 5, 'Client Name': 40, 'Name of Trainer': 12, 'Payment Type': 3}
+MISSING_SHARE = 0.05
+
+
+def make_expenses(seed, rows=3000, days=120):
+    """A loaded dataset of `rows` random expenses over `days` days."""
+    rng = np.random.default_rng(seed)
+    dates = pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, days, rows), unit='D')
+    raw = pd.DataFrame({'Date': dates.strftime('%d/%m/%Y'), 'Cost': rng.integers(100, 10_000, rows) * 1.0})
+    for col, size in DIMENSION_SIZES.items():
+        values = np.array([f'{col} {i}' for i in range(size)], dtype=object)[rng.integers(0, size, rows)]
+        values[rng.random(rows) < MISSING_SHARE] = None
+        raw[col] = values
+    return clean_expense_data(raw)
+
+
+def random_filters(rng, df):
+    """
+    A random sidebar state for `df`: (start_date, end_date, filters), with
+    filters a list of (column, values). Values may be absent from the date
+    range, so some states select no rows.
+    """
+    days = pd.date_range(df['Date'].iloc[0], df['Date'].iloc[-1], freq='D')
+    start, end = sorted(rng.choice(days, 2))
+    filters = []
+    for col in DIMENSION_COLUMNS:
+        if rng.random() < 0.5:
+            categories = df[col].cat.categories
+            size = int(rng.integers(1, len(categories) + 1))
+            filters.append((col, list(rng.choice(categories, size, replace=False))))
+    return pd.Timestamp(start).date(), pd.Timestamp(end).date(), filters
+
+
+def filter_rows(df, start_date, end_date, filters):
+    """The rows of `df` matching a sidebar state, with plain boolean masks."""
+    dates = df['Date']
+    mask = (dates >= pd.Timestamp(start_date)) & (dates < pd.Timestamp(end_date) + pd.Timedelta(days=1))
+    for col, values in filters:
+        mask &= df[col].isin(values)
+    return df[mask]
+
+
+@pytest.fixture(params=[0, 1, 2])
+def expenses(request):
+    return make_expenses(request.param)
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(1234)
@@ -0,0 +1,75 @@
+"""The single-pass weekly matrix matches the old per-group resample('W-MON')."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from aggregation import build_cube, week_labels, weekly_costs, weekly_matrix
+from conftest import filter_rows, random_filters
+
+WEEKLY_DIMENSIONS = ['Region', 'Client Name', 'Name of Trainer', 'Payment Type']
+
+
+def old_weekly_costs(cube, by):
+    return cube.set_index('Date').groupby(by, observed=True)['Cost'].resample('W-MON').sum().reset_index()
+
+
+def assert_same_weekly(cube, by):
+    expected = old_weekly_costs(cube, by)
+    actual = weekly_costs(cube, by)
+    pd.testing.assert_frame_equal(actual, expected, check_names=False, check_categorical=False)
+
+    # The wide matrix holds the same cells, NaN outside each group's weeks
+    matrix = weekly_matrix(cube, by)
+    wide = expected.pivot(index=by, columns='Date', values='Cost').reindex_like(matrix)
+    np.testing.assert_array_equal(matrix.to_numpy(dtype=float), wide.to_numpy(dtype=float))
+
+
+def test_week_labels(expenses):
+    dates = expenses['Date'].drop_duplicates()
+    expected = dates.apply(lambda day: pd.Series([0], index=[day]).resample('W-MON').sum().index[0])
+    pd.testing.assert_series_equal(week_labels(dates), expected, check_names=False)
+
+
+@pytest.mark.parametrize('by', WEEKLY_DIMENSIONS)
+def test_unfiltered(expenses, by):
+    assert_same_weekly(build_cube(expenses), by)
+
+
+def test_random_filters(expenses, rng):
+    for _ in range(15):
+        rows = filter_rows(expenses, *random_filters(rng, expenses))
+        if rows.empty:
+            continue
+        for by in WEEKLY_DIMENSIONS:
+            assert_same_weekly(build_cube(rows), by)
+
+
+def test_missing_dimension_values(expenses):
+    cube = build_cube(expenses)
+    for by in WEEKLY_DIMENSIONS:
+        assert cube[by].isna().any()
+        # Rows without a value in `by` belong to no group, as with groupby
+        assert weekly_costs(cube, by)[by].notna().all()
+
+
+def test_gaps_and_single_weeks():
+    # Region A skips two weeks (zeros in its span); B has a single week
+    dates = pd.to_datetime(['2024-01-02', '2024-01-03', '2024-01-23', '2024-01-16'])
+    rows = pd.DataFrame({
+        'Date': dates,
+        'Region': pd.Categorical(['A', 'A', 'A', 'B']),
+        'Client Name': pd.Categorical(['c1', 'c2', 'c1', 'c3']),
+        'Name of Trainer': pd.Categorical(['t1', 't1', 't2', 't2']),
+        'Payment Type': pd.Categorical(['Cash', 'Cash', 'Card', 'Card']),
+        'Cost': [100.0, 50.0, 25.0, 10.0],
+        'Session_ID': pd.array([0, 1, 2, 3], dtype='Int32'),
+    })
+    assert_same_weekly(build_cube(rows), 'Region')
+    assert weekly_costs(build_cube(rows), 'Region')['Cost'].tolist() == [150.0, 0.0, 0.0, 25.0, 10.0]
+
+
+def test_empty_cube(expenses):
+    cube = build_cube(expenses.iloc[:0])
+    for by in WEEKLY_DIMENSIONS:
+        assert weekly_matrix(cube, by).empty
+        assert weekly_costs(cube, by).empty
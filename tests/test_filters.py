@@ -0,0 +1,104 @@
+"""
+The inverted index gives the same sidebar options and selected rows as
+filtering the frame with boolean masks and `isin`, as the app used to.
+"""
+import pandas as pd
+import pytest
+
+from conftest import make_expenses
+from data_loader import DIMENSION_COLUMNS
+from filters import InvertedIndex, RowSelection, date_bounds, date_range_positions
+
+
+def date_slice(df, start_date, end_date):
+    return RowSelection(*date_range_positions(df, start_date, end_date))
+
+
+def old_date_filter(df, start_date, end_date):
+    return df[(df['Date'].dt.date >= start_date) & (df['Date'].dt.date <= end_date)]
+
+
+def old_options(df, column):
+    return sorted(df[column].dropna().unique())
+
+
+def assert_same_rows(rows, df, expected):
+    assert len(rows) == len(expected)
+    pd.testing.assert_frame_equal(rows.apply(df), expected)
+
+
+def test_date_range_positions(expenses):
+    first, last = date_bounds(expenses)
+    assert first == expenses['Date'].min().date() and last == expenses['Date'].max().date()
+    for start, end in [(first, last), (first, first), (last, last),
+                       (first + pd.Timedelta(days=10), last - pd.Timedelta(days=10))]:
+        assert_same_rows(date_slice(expenses, start, end), expenses, old_date_filter(expenses, start, end))
+
+
+def test_sidebar_cascade(expenses, rng):
+    index = InvertedIndex(expenses)
+    days = pd.date_range(expenses['Date'].iloc[0], expenses['Date'].iloc[-1], freq='D').date
+    for _ in range(30):
+        start_date, end_date = sorted(rng.choice(days, 2))
+        rows = date_slice(expenses, start_date, end_date)
+        filtered = old_date_filter(expenses, start_date, end_date)
+        for col in DIMENSION_COLUMNS:
+            options = index.values(col, rows)
+            assert options == old_options(filtered, col)
+            if not options or rng.random() < 0.3:
+                continue
+            # Some options, all of them, or values absent from the selection
+            choice = rng.integers(3)
+            if choice == 0:
+                selected = list(rng.choice(options, int(rng.integers(1, len(options) + 1)), replace=False))
+            elif choice == 1:
+                selected = options
+            else:
+                selected = [value for value in expenses[col].cat.categories if value not in options][:2]
+            rows = index.select(col, selected, rows)
+            filtered = filtered[filtered[col].isin(selected)]
+            assert_same_rows(rows, expenses, filtered)
+
+
+def test_missing_values(expenses):
+    index = InvertedIndex(expenses)
+    rows = index.all_rows()
+    for col in DIMENSION_COLUMNS:
+        assert expenses[col].isna().any()
+        # Missing values are no option, and selecting every option drops them
+        options = index.values(col, rows)
+        assert options == old_options(expenses, col)
+        assert_same_rows(index.select(col, options, rows), expenses, expenses[expenses[col].notna()])
+
+
+def test_empty_selections(expenses):
+    index = InvertedIndex(expenses)
+    first = expenses['Date'].iloc[0] - pd.Timedelta(days=10)
+    no_dates = date_slice(expenses, first.date(), first.date())
+    assert len(no_dates) == 0
+    assert index.values('Region', no_dates) == []
+    assert_same_rows(index.select('Region', ['Region 0'], no_dates), expenses, expenses.iloc[:0])
+
+    rows = index.all_rows()
+    for values in ([], ['No such region']):
+        selected = index.select('Region', values, rows)
+        assert_same_rows(selected, expenses, expenses.iloc[:0])
+        assert index.values('Client Name', selected) == []
+
+
+@pytest.mark.parametrize('rows', [0, 1])
+def test_tiny_datasets(rows):
+    df = make_expenses(7, rows=5).iloc[:rows].copy()
+    for col in DIMENSION_COLUMNS:
+        df[col] = df[col].cat.remove_unused_categories()
+    index = InvertedIndex(df)
+    all_rows = index.all_rows()
+    for col in DIMENSION_COLUMNS:
+        assert index.values(col, all_rows) == old_options(df, col)
+
+
+def test_apply_columns(expenses):
+    index = InvertedIndex(expenses)
+    rows = index.select('Payment Type', ['Payment Type 0'], index.all_rows())
+    expected = expenses.loc[expenses['Payment Type'] == 'Payment Type 0', ['Date', 'Cost']]
+    pd.testing.assert_frame_equal(rows.apply(expenses, columns=['Date', 'Cost']), expected)
@@ -0,0 +1,67 @@
+"""The DuckDB cube matches build_cube() over the same rows filtered in pandas."""
+import pandas as pd
+import pytest
+
+pytest.importorskip('duckdb')
+
+from aggregation import build_cube
+from conftest import filter_rows, random_filters
+from sql_backend import SQLBackend
+
+
+@pytest.fixture
+def backend(expenses, tmp_path):
+    backend = SQLBackend.from_frame(expenses, str(tmp_path / 'rows.parquet'))
+    yield backend
+    backend.close()
+
+
+def assert_same_cube(actual, expected):
+    pd.testing.assert_frame_equal(actual.reset_index(drop=True), expected.reset_index(drop=True))
+
+
+def test_unfiltered_cube(expenses, backend):
+    assert_same_cube(backend.cube(), build_cube(expenses))
+
+
+def test_random_filters(expenses, backend, rng):
+    for _ in range(25):
+        start_date, end_date, filters = random_filters(rng, expenses)
+        expected = build_cube(filter_rows(expenses, start_date, end_date, filters))
+        assert_same_cube(backend.cube(start_date, end_date, filters), expected)
+
+
+def test_missing_dimension_values_are_kept(expenses, backend):
+    cube = backend.cube()
+    for col in ['Region', 'Client Name', 'Name of Trainer', 'Payment Type']:
+        assert cube[col].isna().any()
+    assert cube['Row Count'].sum() == len(expenses)
+
+
+def test_empty_selections(expenses, backend):
+    first = expenses['Date'].iloc[0] - pd.Timedelta(days=10)
+    expected = build_cube(expenses.iloc[:0])
+    assert_same_cube(backend.cube(first.date(), first.date()), expected)
+    assert_same_cube(backend.cube(filters=[('Region', [])]), expected)
+    assert_same_cube(backend.cube(filters=[('Region', ['No such region'])]), expected)
+
+
+def test_streamed_cube_backend(expenses, tmp_path, rng):
+    # A streamed dataset is held as a cube; its row counts are added up
+    backend = SQLBackend.from_frame(build_cube(expenses), str(tmp_path / 'cube.parquet'))
+    try:
+        for _ in range(10):
+            start_date, end_date, filters = random_filters(rng, expenses)
+            expected = build_cube(filter_rows(expenses, start_date, end_date, filters))
+            assert_same_cube(backend.cube(start_date, end_date, filters), expected)
+    finally:
+        backend.close()
+
+
+def test_close_removes_parquet_copy(expenses, tmp_path):
+    path = tmp_path / 'rows.parquet'
+    backend = SQLBackend.from_frame(expenses, str(path))
+    backend.close()
+    assert not path.exists()
+    with pytest.raises(RuntimeError):
+        backend.cube()